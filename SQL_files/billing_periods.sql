@@ -0,0 +1,28 @@
+set pagesize 50000
+set linesize 1500
+set head off
+set FEEDBACK off
+set ECHO off
+set VERIFY off
+set TERMOUT off
+SET COLSEP ','
+SPOOL billing_periods.csv
+
+SELECT
+    bp.fk_orga_fran,
+    bp.fk_orga_oper,
+    bp.name,
+    bp.FED,
+    bp.LED
+FROM
+    billing_period bp
+WHERE
+    bp.fk_orga_fran = '&1'
+    AND bp.name >= '&2'
+    AND bp.name <= '&3'
+    AND bp.fk_pgrp = 'ITX'
+    AND bp.fk_sdir = 'S'
+;
+
+SPOOL OFF
+exit;
\ No newline at end of file
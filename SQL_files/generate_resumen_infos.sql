@@ -8,14 +8,22 @@ set TERMOUT off
 SET COLSEP ','
 SPOOL generate_resumen_infos.csv
 
+-- The rate window only depends on the arguments, so it is computed once per query in
+-- rate_window instead of twice per row and repeated in the GROUP BY
+WITH rate_window AS (
+    SELECT
+        tch.GET_RATE_FROM_TO( 'RATE_FED', '&1' , '&2','&3', '&4','&5', '&6', '&7', '&8', '&9', '&10') as FED,
+        tch.GET_RATE_FROM_TO( 'RATE_LED', '&1' , '&2','&3', '&4','&5', '&6', '&7', '&8', '&9', '&10') as LED
+    FROM dual
+)
 SELECT
     fs.franchise,
     fs.billing_operator,    
     fs.rating_component,
     bp.name,
     fs.time_premium,
-    tch.GET_RATE_FROM_TO( 'RATE_FED', '&1' , '&2','&3', '&4','&5', '&6', '&7', '&8', '&9', '&10') as FED,
-    tch.GET_RATE_FROM_TO( 'RATE_LED', '&1' , '&2','&3', '&4','&5', '&6', '&7', '&8', '&9', '&10') as LED,
+    rw.FED,
+    rw.LED,
     fs.unit_cost_used,
     SUM(fs.amount),
     SUM(fs.start_call_count)
@@ -23,12 +31,13 @@ FROM
     financial_summary fs
     INNER JOIN billing_period    bp
     on fs.billing_period=bp.id
+    CROSS JOIN rate_window rw
 WHERE
         fs.rating_component = '&5'
         and fs.component_direction='&7'
         and fs.unit_cost_used='&10'
     AND 
-    bp.name = to_char(to_date('&1','DD-MON-RR'),'YYYYMM')
+    bp.name = '&11'
     AND bp.fk_orga_fran = '&3'
     AND bp.fk_orga_oper = '&4'
     AND bp.fk_pgrp = 'ITX'
@@ -39,8 +48,8 @@ GROUP BY
     fs.rating_component,
     bp.name,
     fs.time_premium,
-    tch.GET_RATE_FROM_TO( 'RATE_FED', '&1' , '&2','&3', '&4','&5', '&6', '&7', '&8', '&9', '&10'),
-    tch.GET_RATE_FROM_TO( 'RATE_LED', '&1' , '&2','&3', '&4','&5', '&6', '&7', '&8', '&9', '&10'),
+    rw.FED,
+    rw.LED,
     fs.unit_cost_used;
 
 SPOOL OFF
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import time
+
+from Utils.metrics import BYTES_WRITTEN, EXCEL_SAVE_SECONDS
+
+
+def _fsync_directory(directory: str) -> None:
+    """Persist a rename by syncing its directory (not supported on Windows)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_save(wb, file_path: str) -> int:
+    """
+    Save an xlwt workbook without ever leaving a partially written file behind.
+
+    The workbook is written to a temporary file in the same directory, fsynced
+    and then renamed over file_path, so readers and crashed runs see either
+    the old file or the new one.
+
+    Returns:
+        int: Number of bytes written
+    """
+    started = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            wb.save(f)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    _fsync_directory(directory)
+    EXCEL_SAVE_SECONDS.observe(time.perf_counter() - started)
+    BYTES_WRITTEN.inc(size)
+    return size
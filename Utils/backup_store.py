@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from Utils.metrics import CACHE_REQUESTS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:  # POSIX
+    msvcrt = None
+
+# ioctl request to clone a file's extents (Linux btrfs/xfs/...), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+HASH_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_KEEP_VERSIONS = 5
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    """Clone src into dst without copying data. Returns False when the filesystem can't."""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        try:
+            dst.unlink()
+        except OSError:
+            pass
+        return False
+
+
+def index_key(file_path: str) -> str:
+    """Index key of a file: its resolved path, so same-named files in different directories stay apart."""
+    return os.path.normcase(str(Path(file_path).resolve()))
+
+
+class BackupStore:
+    """
+    Content-addressed backup store for Excel files.
+
+    Backups are stored once per distinct content under objects/<sha[:2]>/<sha><suffix>,
+    so backing up an unchanged file again costs a hash and no write. index.json
+    maps each file's resolved path to its versions (oldest first), so finding
+    what to restore is a dict lookup.
+
+    Several processes may share a store (watch mode, --ledger nodes, the
+    layout_317 worker pool), so storing an object, updating the index and
+    applying retention happen under an exclusive lock on the .lock file.
+
+    Objects are created with a reflink when the filesystem supports it and a
+    streaming copy otherwise. Hardlinks are never used: a backed-up file that
+    is later overwritten in place (a failed run, a reissued file copied over
+    it) would silently change its stored original.
+
+    A file whose size and mtime match its latest indexed version is treated
+    as already backed up and is neither hashed nor copied.
+
+    Retention keeps the first version of every file (the original before any
+    Resumen was added) plus the latest keep_versions versions, and drops
+    versions older than max_age_days. The newest version is always kept, even
+    with keep_versions=0 or when it is older than max_age_days.
+    """
+
+    def __init__(self, root: Path, keep_versions: int = DEFAULT_KEEP_VERSIONS,
+                 max_age_days: Optional[int] = None):
+        self.root = Path(root)
+        self.objects_dir = self.root / 'objects'
+        self.index_file = self.root / 'index.json'
+        self.lock_file = self.root / '.lock'
+        self.keep_versions = keep_versions
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the store lock, against other threads and other processes."""
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_file, 'a+b') as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                elif msvcrt is not None:
+                    f.seek(0)
+                    while True:
+                        # LK_LOCK gives up with OSError after 10 one-second attempts
+                        try:
+                            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            continue
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                    elif msvcrt is not None:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _load_index(self) -> Dict[str, List[Dict]]:
+        if not self.index_file.exists():
+            return {}
+        with open(self.index_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_index(self, index: Dict[str, List[Dict]]) -> None:
+        tmp_file = self.index_file.with_name(f"{self.index_file.name}.{os.getpid()}.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_file, self.index_file)
+
+    def _object_path(self, sha256: str, suffix: str) -> Path:
+        return self.objects_dir / sha256[:2] / f"{sha256}{suffix}"
+
+    def _store_object(self, src: Path, dst: Path) -> str:
+        """Create dst from src and return the method used."""
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dst = dst.with_name(f"{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+        method = 'reflink'
+        if not _reflink(src, tmp_dst):
+            method = 'copy'
+            with open(src, 'rb') as fsrc, open(tmp_dst, 'wb') as fdst:
+                shutil.copyfileobj(fsrc, fdst, HASH_CHUNK_SIZE)
+            shutil.copystat(src, tmp_dst)
+
+        os.replace(tmp_dst, dst)
+        return method
+
+    def backup(self, file_path: str) -> Path:
+        """
+        Back up a file, skipping the write when identical content is already stored.
+
+        Returns:
+            Path: Location of the backup object
+        """
+        src = Path(file_path)
+        key = index_key(file_path)
+        stat = src.stat()
+
+        # Files already in the index with the same size and mtime need no hash and no copy
+        with self._locked():
+            versions = self._load_index().get(key)
+        if versions:
+            latest = versions[-1]
+            obj = self.root / latest['object']
+            if latest.get('size') == stat.st_size and latest.get('mtime_ns') == stat.st_mtime_ns and obj.exists():
+                CACHE_REQUESTS.inc(cache='backup', result='hit')
+                print(f"💾 {src.name} unchanged since its last backup, skipping")
+                return obj
+
+        sha256 = file_sha256(src)
+        obj = self._object_path(sha256, src.suffix)
+
+        with self._locked():
+            if obj.exists():
+                CACHE_REQUESTS.inc(cache='backup', result='hit')
+                print(f"💾 Backup already stored for {src.name} ({sha256[:12]}), skipping copy")
+            else:
+                CACHE_REQUESTS.inc(cache='backup', result='miss')
+                method = self._store_object(src, obj)
+                print(f"💾 Backup created ({method}): {obj}")
+
+            index = self._load_index()
+            versions = index.setdefault(key, [])
+            if not versions or versions[-1]['sha256'] != sha256:
+                versions.append({
+                    'sha256': sha256,
+                    'object': obj.relative_to(self.root).as_posix(),
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                })
+                unreferenced = self._apply_retention(index)
+                # Index first, so it never lists a deleted object
+                self._save_index(index)
+                for path in unreferenced:
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+            elif versions[-1].get('mtime_ns') != stat.st_mtime_ns:
+                # Same content with a new mtime, remember it for the fast path
+                versions[-1]['mtime_ns'] = stat.st_mtime_ns
+                self._save_index(index)
+
+        return obj
+
+    def latest(self, file_path: str) -> Optional[Path]:
+        """Return the most recent backup of a file, if any."""
+        versions = self._load_index().get(index_key(file_path))
+        if not versions:
+            return None
+        return self.root / versions[-1]['object']
+
+    def original(self, file_path: str) -> Optional[Path]:
+        """Return the first backup ever taken of a file, if any."""
+        versions = self._load_index().get(index_key(file_path))
+        if not versions:
+            return None
+        return self.root / versions[0]['object']
+
+    def restore(self, file_path: str, dest: str) -> bool:
+        """
+        Restore the most recent backup of file_path to dest.
+
+        A copy is always made (never a link) so later writes to dest can't
+        change the stored backup.
+        """
+        obj = self.latest(file_path)
+        if obj is None or not obj.exists():
+            return False
+        tmp_dest = Path(f"{dest}.restore.tmp")
+        shutil.copy2(obj, tmp_dest)
+        os.replace(tmp_dest, dest)
+        return True
+
+    def _apply_retention(self, index: Dict[str, List[Dict]]) -> List[Path]:
+        """
+        Drop the versions retention no longer keeps.
+
+        Returns:
+            List[Path]: Objects of the dropped versions that no kept version references.
+                Only these may be deleted; objects/ is never swept, since other
+                processes may have stored objects they haven't indexed yet
+        """
+        cutoff = None
+        if self.max_age_days is not None:
+            cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat(timespec='seconds')
+
+        dropped = []
+        for key, versions in index.items():
+            # Always keep the original and the newest version
+            kept = [versions[0]]
+            recent = versions[1:][-max(self.keep_versions, 1):]
+            for i, version in enumerate(recent):
+                is_newest = i == len(recent) - 1
+                if cutoff is None or version['created'] >= cutoff or is_newest:
+                    kept.append(version)
+            dropped.extend(version for version in versions if version not in kept)
+            index[key] = kept
+
+        referenced = {version['object'] for versions in index.values() for version in versions}
+        return sorted({self.root / version['object'] for version in dropped if version['object'] not in referenced})
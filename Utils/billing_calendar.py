@@ -0,0 +1,203 @@
+from bisect import bisect_right
+from datetime import date
+from functools import lru_cache
+from typing import Callable, Dict, Generic, Iterable, List, NamedTuple, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+MONTHS = {name: number for number, name in enumerate(
+    ('JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC'), start=1)}
+
+# Columns of billing_periods.csv
+COL_FRANCHISE = 0
+COL_FK_ORGA_OPER = 1
+COL_NAME = 2
+COL_FED = 3
+COL_LED = 4
+
+# Columns of resumen.txt rows
+RESUMEN_COL_PERIOD = 3
+RESUMEN_COL_TIME_PREMIUM = 4
+RESUMEN_COL_FED = 5
+RESUMEN_COL_LED = 6
+
+
+@lru_cache(maxsize=4096)
+def parse_oracle_date(value: str) -> Optional[date]:
+    """
+    Parse an Oracle DD-MON-RR date ('01-SEP-25'), returning None for blanks.
+
+    RR years 00-49 are read as 20xx and 50-99 as 19xx, as Oracle does in this century.
+
+    Raises:
+        ValueError: If the value is not a DD-MON-RR or DD-MON-YYYY date
+    """
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        day, month, year = value.split('-')
+        year_number = int(year)
+        if len(year) == 2:
+            year_number += 2000 if year_number < 50 else 1900
+        return date(year_number, MONTHS[month.upper()], int(day))
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid DD-MON-RR date: {value!r}")
+
+
+def format_oracle_date(day: date) -> str:
+    return day.strftime('%d-%b-%y').upper()
+
+
+class IntervalIndex(Generic[T]):
+    """
+    Closed date intervals sorted by start, for bisect-based lookups.
+
+    max_end[i] is the latest end among the first i+1 intervals, so a query
+    stops scanning left as soon as no earlier interval can reach it.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[date, date, T]]):
+        self._intervals = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+        self._starts = [interval[0] for interval in self._intervals]
+        self._max_end: List[date] = []
+        for start, end, _ in self._intervals:
+            self._max_end.append(max(end, self._max_end[-1]) if self._max_end else end)
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def overlapping(self, start: date, end: date) -> List[T]:
+        """Return the values of every interval sharing at least one day with [start, end]."""
+        result = []
+        i = bisect_right(self._starts, end) - 1
+        while i >= 0 and self._max_end[i] >= start:
+            interval_start, interval_end, value = self._intervals[i]
+            if interval_end >= start:
+                result.append(value)
+            i -= 1
+        result.reverse()
+        return result
+
+
+class BillingPeriod(NamedTuple):
+    franchise: str
+    operator: str
+    name: str
+    fed: date
+    led: date
+
+
+class BillingCalendar:
+    """
+    Billing period windows loaded once per run from billing_period.
+
+    A period name can hold several windows when its rates changed mid-period
+    (01-SEP-25..24-SEP-25 and 25-SEP-25..30-SEP-25). Windows are indexed by
+    date through one IntervalIndex per (franchise, fk_orga_oper), and each
+    period name keeps the span from its first FED to its last LED.
+    """
+
+    def __init__(self, periods: Iterable[BillingPeriod] = ()):
+        self._spans: Dict[Tuple[str, str, str], Tuple[date, date]] = {}
+        grouped: Dict[Tuple[str, str], List[BillingPeriod]] = {}
+        for period in periods:
+            key = (period.franchise, period.operator, period.name)
+            fed, led = self._spans.get(key, (period.fed, period.led))
+            self._spans[key] = (min(fed, period.fed), max(led, period.led))
+            grouped.setdefault((period.franchise, period.operator), []).append(period)
+        self._by_operator = {key: IntervalIndex((p.fed, p.led, p) for p in values)
+                             for key, values in grouped.items()}
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[str]) -> 'BillingCalendar':
+        periods = []
+        for line in lines:
+            columns = [column.strip() for column in line.split(',')]
+            if len(columns) <= COL_LED or not columns[COL_NAME]:
+                continue
+            fed = parse_oracle_date(columns[COL_FED])
+            led = parse_oracle_date(columns[COL_LED])
+            if fed is None or led is None:
+                continue
+            periods.append(BillingPeriod(columns[COL_FRANCHISE], columns[COL_FK_ORGA_OPER], columns[COL_NAME], fed, led))
+        return cls(periods)
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self._by_operator.values())
+
+    def overlapping(self, franchise: str, operator: str, start: date, end: date) -> List[BillingPeriod]:
+        """Billing windows of an fk_orga_oper that overlap [start, end], e.g. a rate validity window."""
+        index = self._by_operator.get((franchise, operator))
+        return index.overlapping(start, end) if index is not None else []
+
+    def rate_windows(self, franchise: str, operator: str, row: List[str]) -> List[BillingPeriod]:
+        """
+        Billing windows of a resumen row's period that its rate window overlaps.
+
+        The row's FED/LED are clipped to the period's span, and a blank bound
+        stands for the span's edge, so a row without dates matches every window
+        of its period. Rows are not keyed on their own billing_operator column:
+        operator is the fk_orga_oper of the query key they were fetched for.
+        """
+        if len(row) <= RESUMEN_COL_LED:
+            return []
+        span = self._spans.get((franchise, operator, row[RESUMEN_COL_PERIOD]))
+        if span is None:
+            return []
+        try:
+            fed = parse_oracle_date(row[RESUMEN_COL_FED])
+            led = parse_oracle_date(row[RESUMEN_COL_LED])
+        except ValueError:
+            return []
+        start = max(fed or span[0], span[0])
+        end = min(led or span[1], span[1])
+        if start > end:
+            return []
+        return [window for window in self.overlapping(franchise, operator, start, end)
+                if window.name == row[RESUMEN_COL_PERIOD]]
+
+    def fill_rate_window(self, franchise: str, operator: str, row: List[str]) -> bool:
+        """
+        Fill a blank FED/LED of a resumen row with the bounds of its billing window.
+
+        Rows that overlap several windows of a split period are left blank.
+
+        Returns:
+            bool: True if the row was changed
+        """
+        if len(row) <= RESUMEN_COL_LED or (row[RESUMEN_COL_FED] and row[RESUMEN_COL_LED]):
+            return False
+        windows = self.rate_windows(franchise, operator, row)
+        if len(windows) != 1:
+            return False
+        if not row[RESUMEN_COL_FED]:
+            row[RESUMEN_COL_FED] = format_oracle_date(windows[0].fed)
+        if not row[RESUMEN_COL_LED]:
+            row[RESUMEN_COL_LED] = format_oracle_date(windows[0].led)
+        return True
+
+    def sort_key(self, franchise: str, operator: str) -> Callable[[List[str]], Tuple[date, date, date, date, str]]:
+        """
+        Order resumen rows by the first billing window they overlap, then by resumen_sort_key.
+
+        Rows of a split period are grouped per window even when a rate window
+        starts before the period; rows matching no window sort first.
+        """
+        def key(row: List[str]) -> Tuple[date, date, date, date, str]:
+            windows = self.rate_windows(franchise, operator, row)
+            window = (windows[0].fed, windows[0].led) if windows else (date.min, date.min)
+            return window + resumen_sort_key(row)
+        return key
+
+
+def resumen_sort_key(row: List[str]) -> Tuple[date, date, str]:
+    """Order resumen rows by rate window (FED, then LED) and time premium; unparsable dates sort first."""
+    if len(row) <= RESUMEN_COL_LED:
+        return date.min, date.min, ''
+    try:
+        fed = parse_oracle_date(row[RESUMEN_COL_FED]) or date.min
+        led = parse_oracle_date(row[RESUMEN_COL_LED]) or date.min
+    except ValueError:
+        fed = led = date.min
+    return fed, led, row[RESUMEN_COL_TIME_PREMIUM]
@@ -0,0 +1,62 @@
+from typing import Any, Dict, Iterable, Optional
+
+# xlwt column widths are expressed in 1/256 of the width of the '0' character
+CHAR_WIDTH = 256
+DEFAULT_MIN_WIDTH = 10 * CHAR_WIDTH
+DEFAULT_MAX_WIDTH = 60 * CHAR_WIDTH
+DEFAULT_PADDING = 2 * CHAR_WIDTH
+XLS_MAX_WIDTH = 65535
+
+
+def rendered_length(value: Any) -> int:
+    """Return the number of characters a cell value takes once rendered."""
+    if value is None:
+        return 0
+    if isinstance(value, float) and value.is_integer():
+        return len(str(int(value)))
+    return len(str(value))
+
+
+class WidthTrackingWriter:
+    """
+    Write cells to an xlwt sheet while recording the widest rendered value per column.
+
+    Tracking costs one length computation and one dict lookup per cell, so the
+    widths are known as soon as the last row is written and no second pass over
+    the data is needed. Call apply_widths() once writing is finished, right
+    before the workbook is saved.
+    """
+
+    def __init__(self, sheet, min_width: int = DEFAULT_MIN_WIDTH, max_width: int = DEFAULT_MAX_WIDTH,
+                 padding: int = DEFAULT_PADDING):
+        if min_width > max_width:
+            raise ValueError(f"min_width ({min_width}) cannot be greater than max_width ({max_width})")
+        self.sheet = sheet
+        self.min_width = min_width
+        self.max_width = min(max_width, XLS_MAX_WIDTH)
+        self.padding = padding
+        self.max_chars: Dict[int, int] = {}
+
+    def write(self, row: int, col: int, value: Any, style: Optional[Any] = None) -> None:
+        if style is None:
+            self.sheet.write(row, col, value)
+        else:
+            self.sheet.write(row, col, value, style)
+
+        length = rendered_length(value)
+        if length > self.max_chars.get(col, 0):
+            self.max_chars[col] = length
+
+    def write_row(self, row: int, values: Iterable[Any], style: Optional[Any] = None) -> None:
+        for col, value in enumerate(values):
+            self.write(row, col, value, style)
+
+    def column_width(self, col: int) -> int:
+        """Return the capped width for a column based on what has been written so far."""
+        width = self.max_chars.get(col, 0) * CHAR_WIDTH + self.padding
+        return max(self.min_width, min(width, self.max_width))
+
+    def apply_widths(self) -> None:
+        """Set the width of every written column on the underlying sheet."""
+        for col in self.max_chars:
+            self.sheet.col(col).width = self.column_width(col)
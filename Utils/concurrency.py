@@ -0,0 +1,162 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from Utils.metrics import DB_CONCURRENCY_LIMIT, DB_IN_FLIGHT
+
+DEFAULT_FLOOR = 1
+DEFAULT_CEILING = 8
+DEFAULT_INITIAL = 2
+# A query slower than TOLERANCE times its template's baseline latency, and at least
+# MIN_EXCESS seconds over it, is a congestion signal
+DEFAULT_TOLERANCE = 2.0
+DEFAULT_MIN_EXCESS = 0.25
+DEFAULT_BACKOFF = 0.5
+BASELINE_SMOOTHING = 0.1
+
+
+def parse_limits(value: str) -> Tuple[int, int]:
+    """
+    Parse a 'FLOOR:CEILING' concurrency range, e.g. '1:8'.
+
+    Raises:
+        ValueError: If the range is malformed or not 1 <= FLOOR <= CEILING
+    """
+    try:
+        floor, ceiling = (int(part) for part in value.split(':'))
+    except ValueError:
+        raise ValueError(f"Invalid concurrency range '{value}', expected FLOOR:CEILING such as 1:8")
+    if not 1 <= floor <= ceiling:
+        raise ValueError(f"Invalid concurrency range '{value}', need 1 <= FLOOR <= CEILING")
+    return floor, ceiling
+
+
+class Slot:
+    """
+    One admitted query; the caller times the query itself with timed() and
+    marks it as failed when the DB returned errors.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.started = time.monotonic()
+        self.latency: Optional[float] = None
+        self.error = False
+
+    @contextmanager
+    def timed(self) -> Iterator[None]:
+        """Measure the block as the query's latency, leaving out waits such as opening a session."""
+        began = time.monotonic()
+        try:
+            yield
+        finally:
+            self.latency = time.monotonic() - began
+
+    def mark_error(self) -> None:
+        self.error = True
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on the number of DB queries in flight.
+
+    Each finished query adds 1/limit to the limit, so it grows by about one
+    per round of queries while the database keeps up (additive increase).
+    A query that fails, or that takes more than tolerance times the usual
+    latency of its SQL template and at least min_excess seconds more,
+    multiplies the limit by backoff (multiplicative decrease). The absolute
+    margin keeps jitter on millisecond queries from halving the limit. Only
+    queries started after the last decrease can trigger another one, so a
+    burst of slow queries that were all in flight at once counts as a single
+    signal. The limit stays between floor and ceiling.
+
+    The usual latency is a moving average per template, since a
+    rates_info_search and a generate_resumen_infos query don't cost the same.
+    Only the time measured by Slot.timed() counts, so connecting a new
+    session when the limit grows is not mistaken for a slow query.
+    Slow samples only nudge it, so it follows a lasting change in the
+    database without treating every slow query as the new normal.
+    """
+
+    def __init__(self, floor: int = DEFAULT_FLOOR, ceiling: int = DEFAULT_CEILING,
+                 initial: Optional[int] = DEFAULT_INITIAL, tolerance: float = DEFAULT_TOLERANCE,
+                 backoff: float = DEFAULT_BACKOFF, min_excess: float = DEFAULT_MIN_EXCESS):
+        self._condition = threading.Condition()
+        self._baselines: Dict[str, float] = {}
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.min_excess = min_excess
+        self.configure(floor, ceiling, initial)
+
+    def configure(self, floor: int, ceiling: int, initial: Optional[int] = None) -> None:
+        if not 1 <= floor <= ceiling:
+            raise ValueError(f"Need 1 <= floor <= ceiling, got {floor}:{ceiling}")
+        with self._condition:
+            self.floor = floor
+            self.ceiling = ceiling
+            start = initial if initial is not None else floor
+            self._limit = float(min(max(start, floor), ceiling))
+            DB_CONCURRENCY_LIMIT.set(self.limit)
+            self._condition.notify_all()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @contextmanager
+    def slot(self, key: str) -> Iterator[Slot]:
+        """Wait until the limit admits another query, then run the block as one query of template key."""
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+            DB_IN_FLIGHT.set(self._in_flight)
+
+        slot = Slot(key)
+        try:
+            yield slot
+        except BaseException:
+            slot.mark_error()
+            raise
+        finally:
+            self._release(slot)
+
+    def _release(self, slot: Slot) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            DB_IN_FLIGHT.set(self._in_flight)
+            before = self.limit
+
+            latency = slot.latency
+            baseline = self._baselines.get(slot.key)
+            slow = (latency is not None and baseline is not None
+                    and latency > self.tolerance * baseline and latency - baseline >= self.min_excess)
+            if latency is not None and baseline is None:
+                self._baselines[slot.key] = latency
+            elif latency is not None:
+                weight = BASELINE_SMOOTHING / 10 if slow else BASELINE_SMOOTHING
+                self._baselines[slot.key] = baseline + weight * (latency - baseline)
+
+            if slot.error or slow:
+                if slot.started >= self._last_decrease:
+                    self._limit = max(float(self.floor), self._limit * self.backoff)
+                    self._last_decrease = time.monotonic()
+            else:
+                self._limit = min(float(self.ceiling), self._limit + 1 / self._limit)
+
+            if self.limit != before:
+                DB_CONCURRENCY_LIMIT.set(self.limit)
+                if self.limit < before:
+                    reason = 'error' if slot.error else f"{latency:.2f}s vs {baseline:.2f}s usual"
+                    print(f"🎚️  DB concurrency {before} → {self.limit} ({slot.key}: {reason})")
+            self._condition.notify_all()
+
+
+LIMITER = AdaptiveLimiter()
@@ -0,0 +1,21 @@
+from functools import lru_cache
+from pathlib import Path
+
+ENV_PATH = Path(__file__).resolve().parent.parent / "config" / ".env"
+
+
+@lru_cache(maxsize=None)
+def load_env() -> bool:
+    """
+    Load config/.env into the environment on first use.
+
+    python-dotenv is imported here rather than at module import time, so
+    entry points that never reach the database don't pay for it.
+
+    Returns:
+        bool: True if the .env file exists and was loaded
+    """
+    if not ENV_PATH.exists():
+        return False
+    from dotenv import load_dotenv
+    return load_dotenv(str(ENV_PATH))
@@ -0,0 +1,170 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# OMV types appear in the antepenultimate position of the filename
+OMV_TYPES = ('210', '212', '216', '236', '242', '250', '253')
+
+PERIOD_PATTERN = re.compile(r'^\d{4}(0[1-9]|1[0-2])$')
+DATE_PATTERN = re.compile(r'^\d{8}$')
+TIME_PATTERN = re.compile(r'^\d{6}$')
+DIGITS_PATTERN = re.compile(r'^\d+$')
+
+
+class FilenameError(ValueError):
+    """Raised when a liquidation filename does not follow the expected format."""
+
+
+class FilenameRecord(NamedTuple):
+    """
+    Typed view of a liquidation filename.
+
+    {FRANCHISE}_{OPERATOR}_{COMPANY}_{PERIOD}_{RATING_COMPONENT}_{R}_{DIRECTION}[_{OMV_TYPE}]_{DATE}_{TIME}.xls
+    """
+    filename: str
+    franchise: str
+    operator: str
+    company: str
+    period: str
+    rating_component: str
+    direction: str
+    omv_type: Optional[str]
+    timestamp: str
+
+    @property
+    def is_omv(self) -> bool:
+        return self.omv_type is not None
+
+    @property
+    def query_key(self) -> Tuple[str, str, str, str, str]:
+        """Parameters of rates_info_search.sql; files sharing a key share the same DB results."""
+        return (self.franchise, self.operator, self.period, self.rating_component, self.direction)
+
+
+class ValidationReport(NamedTuple):
+    """Result of parsing every file of a directory before any DB or Excel work."""
+    valid: List[FilenameRecord]
+    invalid: List[Tuple[str, str]]
+    groups: Dict[Tuple[str, str, str, str, str], List[FilenameRecord]]
+
+    def summary(self) -> str:
+        return (f"{len(self.valid)} valid, {len(self.invalid)} rejected, "
+                f"{len(self.groups)} distinct query keys")
+
+
+def load_rating_components(rating_component_file: Path) -> List[str]:
+    """Read rating component ids (one per line) from rating_component_list.csv, longest first."""
+    if not rating_component_file.exists():
+        return []
+    with open(rating_component_file, 'r', encoding='utf-8') as f:
+        components = {line.strip() for line in f if line.strip()}
+    return sorted(components, key=len, reverse=True)
+
+
+def parse_filename(filename: str, rating_components: Iterable[str] = ()) -> FilenameRecord:
+    """
+    Parse a liquidation filename into a FilenameRecord.
+
+    The name is anchored on the right: time, date, optional OMV type, direction
+    and the R marker have fixed positions, so only the split between company,
+    period and rating component is ambiguous. A rating component from
+    rating_components (ids containing '_') that ends right before the R marker
+    resolves it; otherwise the period is the last YYYYMM token that leaves at
+    least one company token before it and one component token after it.
+
+    Raises:
+        FilenameError: If the name does not follow the expected format
+    """
+    stem = Path(filename).stem
+    parts = stem.split('_')
+
+    # fran, oper, company, period, component, R, direction, date, time
+    if len(parts) < 9:
+        raise FilenameError(f"Filename must have at least 9 parts separated by '_'. Got {len(parts)} parts: {filename}")
+
+    date_part, time_part = parts[-2], parts[-1]
+    if not DATE_PATTERN.match(date_part) or not TIME_PATTERN.match(time_part):
+        raise FilenameError(f"Filename must end with a YYYYMMDD_HHMMSS timestamp: {filename}")
+
+    omv_type = parts[-3] if parts[-3] in OMV_TYPES else None
+    # Tokens after the rating component: R, direction, [omv], date, time
+    tail = 5 if omv_type else 4
+    component_end = len(parts) - tail
+
+    period_idx = None
+    for component in rating_components:
+        width = component.count('_') + 1
+        start = component_end - width
+        if start > 3 and '_'.join(parts[start:component_end]) == component and PERIOD_PATTERN.match(parts[start - 1]):
+            period_idx = start - 1
+            break
+
+    if period_idx is None:
+        for idx in range(component_end - 2, 2, -1):
+            if PERIOD_PATTERN.match(parts[idx]):
+                period_idx = idx
+                break
+
+    if period_idx is None:
+        raise FilenameError(f"No YYYYMM period found between company and rating component: {filename}")
+
+    franchise, operator = parts[0], parts[1]
+    if not DIGITS_PATTERN.match(franchise) or not DIGITS_PATTERN.match(operator):
+        raise FilenameError(f"Franchise and operator must be numeric. Got '{franchise}' and '{operator}': {filename}")
+
+    direction = parts[component_end + 1]
+    if not direction:
+        raise FilenameError(f"Empty component direction: {filename}")
+
+    return FilenameRecord(
+        filename=filename,
+        franchise=franchise,
+        operator=operator,
+        company='_'.join(parts[2:period_idx]),
+        period=parts[period_idx],
+        rating_component='_'.join(parts[period_idx + 1:component_end]),
+        direction=direction,
+        omv_type=omv_type,
+        timestamp=f"{date_part}_{time_part}",
+    )
+
+
+def _parse_or_error(filename: str, rating_components: Sequence[str]) -> Tuple[Optional[FilenameRecord], str]:
+    try:
+        return parse_filename(filename, rating_components), ""
+    except FilenameError as e:
+        return None, str(e)
+
+
+def validate_filenames(filenames: Iterable[str], rating_components: Sequence[str] = (),
+                       max_workers: Optional[int] = None) -> ValidationReport:
+    """
+    Parse every filename up front and group the valid ones by query key.
+
+    Args:
+        filenames: File names (not paths) to validate
+        rating_components: Known rating component ids, see parse_filename
+        max_workers: Thread pool size used to parse the names
+
+    Returns:
+        ValidationReport: valid records, rejected (filename, reason) pairs and query key groups
+    """
+    filenames = list(filenames)
+    # Longest ids first so 'A_B_C' wins over 'B_C'
+    components = sorted(set(rating_components), key=len, reverse=True)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda name: _parse_or_error(name, components), filenames))
+
+    valid = []
+    invalid = []
+    groups: Dict[Tuple[str, str, str, str, str], List[FilenameRecord]] = {}
+    for filename, (record, error) in zip(filenames, results):
+        if record is None:
+            invalid.append((filename, error))
+            continue
+        valid.append(record)
+        groups.setdefault(record.query_key, []).append(record)
+
+    return ValidationReport(valid=valid, invalid=invalid, groups=groups)
@@ -0,0 +1,85 @@
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+# (size, mtime_ns) of a file, used to notice new and changed files
+Signature = Tuple[int, int]
+
+
+def file_signature(path: Path) -> Optional[Signature]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class FolderWatcher:
+    """
+    Poll a directory for new or changed files.
+
+    A file is only reported once its size and modification time have stayed the
+    same for `debounce` seconds, so files still being copied into the folder are
+    not picked up half-written. Reported files are considered in flight until
+    mark_done() records their signature after processing; the modification
+    made by processing itself is therefore not reported again.
+    """
+
+    def __init__(self, directory: Path, pattern: str = "*.xls", debounce: float = 5.0,
+                 include_existing: bool = False):
+        self.directory = Path(directory)
+        self.pattern = pattern
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._done: Dict[Path, Signature] = {}
+        self._candidates: Dict[Path, Tuple[Signature, float]] = {}
+        self._in_flight: Set[Path] = set()
+
+        if not include_existing:
+            for path in self.directory.glob(self.pattern):
+                signature = file_signature(path)
+                if signature is not None:
+                    self._done[path] = signature
+
+    def poll(self) -> List[Path]:
+        """Return files that are new or changed and have been stable for the debounce period."""
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            current = set()
+            for path in self.directory.glob(self.pattern):
+                current.add(path)
+                if path in self._in_flight:
+                    continue
+                signature = file_signature(path)
+                if signature is None or self._done.get(path) == signature:
+                    self._candidates.pop(path, None)
+                    continue
+
+                previous = self._candidates.get(path)
+                if previous is None or previous[0] != signature:
+                    # New or still changing, restart the debounce window
+                    self._candidates[path] = (signature, now)
+                elif now - previous[1] >= self.debounce:
+                    del self._candidates[path]
+                    self._in_flight.add(path)
+                    ready.append(path)
+
+            # Forget files that were removed from the folder
+            for path in list(self._candidates):
+                if path not in current:
+                    del self._candidates[path]
+            for path in list(self._done):
+                if path not in current:
+                    del self._done[path]
+
+        return sorted(ready)
+
+    def mark_done(self, path: Path) -> None:
+        """Record the file as processed in its current state."""
+        with self._lock:
+            self._in_flight.discard(path)
+            signature = file_signature(path)
+            if signature is not None:
+                self._done[path] = signature
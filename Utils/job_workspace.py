@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+# Memory-backed scratch space on Linux; falls back to the system temp dir
+TMPFS_DIRS = ('/dev/shm',)
+WORKSPACE_PREFIX = 'add_sheet_'
+
+
+def scratch_root() -> Path:
+    """Return a local writable directory for scratch files, preferring tmpfs."""
+    override = os.getenv("ADD_SHEET_SCRATCH_DIR")
+    candidates: List[str] = [override] if override else []
+    candidates.extend(TMPFS_DIRS)
+    for candidate in candidates:
+        if os.path.isdir(candidate) and os.access(candidate, os.W_OK | os.X_OK):
+            return Path(candidate)
+    return Path(tempfile.gettempdir())
+
+
+class JobWorkspace:
+    """
+    Private scratch directory for one job (a run or a single file).
+
+    Every intermediate file of the job (rates_info_search.csv,
+    generate_resumen_infos_<line>.csv, resumen.txt, ...) lives here instead of at a
+    fixed path shared by every invocation, so concurrent runs can't read each
+    other's results. The directory is removed when the job succeeds and kept
+    for debugging when it raises or is marked as failed.
+    """
+
+    def __init__(self, label: str = 'job', root: Optional[Path] = None):
+        self.label = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in label)[:60]
+        self.root = Path(root) if root is not None else scratch_root()
+        self.path: Optional[Path] = None
+        self.failed = False
+
+    def __enter__(self) -> 'JobWorkspace':
+        self.path = Path(tempfile.mkdtemp(prefix=f"{WORKSPACE_PREFIX}{self.label}_", dir=self.root))
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None or self.failed:
+            print(f"🗂️  Keeping job workspace for debugging: {self.path}")
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+        return False
+
+    def mark_failed(self) -> None:
+        """Keep the directory on exit even though no exception was raised."""
+        self.failed = True
+
+    def subdir(self, name: str) -> Path:
+        """Create a directory inside the workspace, e.g. one per query group of a run."""
+        path = self.path / ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+        path.mkdir(exist_ok=True)
+        return path
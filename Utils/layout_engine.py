@@ -0,0 +1,240 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from Utils.numeric_parsing import Location, NumericParseError, parse_amounts, parse_rates
+
+LAYOUT_MODELS_DIR = Path(__file__).resolve().parent.parent / 'layout_models'
+
+# Legacy model_317.json keys, one per output row
+LEGACY_317_HEADERS = ["IDD_CONCESION", "IDD_OPERADOR", "Servicio", "Periodo", "Mensajes", "Monto",
+                      "Tramo_Tarifario", "Descripcion_tramo_tarifario"]
+LEGACY_317_FIELDS = (("Monto", "MONTO", "amount"), ("Tramo_Tarifario", "TARIFA", "rate"),
+                     ("Descripcion_tramo_tarifario", "DESCRIPCION_TRAMO_TARIFARIO", "raw"))
+
+
+class LayoutError(ValueError):
+    """Raised when a layout model is invalid or a sheet does not match it."""
+
+
+def _parse_raw(values: List[Any], locations: List[Optional[Location]]) -> List[Any]:
+    return list(values)
+
+
+def _parse_text(values: List[Any], locations: List[Optional[Location]]) -> List[Any]:
+    return [str(value).strip() for value in values]
+
+
+# Parsers work on a whole column; locations are the source cells, None for non-cell values
+PARSERS: Dict[str, Callable[[List[Any], List[Optional[Location]]], List[Any]]] = {
+    'raw': _parse_raw,
+    'text': _parse_text,
+    'amount': parse_amounts,
+    'rate': parse_rates,
+}
+
+
+class Anchor:
+    """The nth occurrence of a label in the sheet, shifted by a row/column offset."""
+
+    def __init__(self, label: str, occurrence: int, row_offset: int = 0, col_offset: int = 0):
+        self.label = label
+        self.occurrence = occurrence
+        self.row_offset = row_offset
+        self.col_offset = col_offset
+
+
+class ColumnPlan:
+    """Where the values of one output column come from, one per output row."""
+
+    def __init__(self, header: str, kind: str, sources: Sequence[Any], parser_name: str = 'raw'):
+        if parser_name not in PARSERS:
+            raise LayoutError(f"Unknown parser '{parser_name}' for column '{header}'. Known: {sorted(PARSERS)}")
+        self.header = header
+        self.kind = kind
+        self.sources = list(sources)
+        self.parser_name = parser_name
+        self.parser = PARSERS[parser_name]
+
+
+class ExtractionPlan:
+    """
+    Precomputed extraction plan of a layout model.
+
+    Cell coordinates, label anchors and parsers are resolved once when the
+    model is compiled. run() then scans the sheet at most once, for all
+    anchor labels together, and reads every other value by coordinate.
+    """
+
+    def __init__(self, model: str, sheet_index: int, output_sheet: str, row_count: int,
+                 columns: List[ColumnPlan]):
+        self.model = model
+        self.sheet_index = sheet_index
+        self.output_sheet = output_sheet
+        self.row_count = row_count
+        self.columns = columns
+        self.headers = [column.header for column in columns]
+
+        # Highest occurrence needed per label, so the scan can stop early
+        self.labels: Dict[str, int] = {}
+        for column in columns:
+            if column.kind == 'anchor':
+                for anchor in column.sources:
+                    self.labels[anchor.label] = max(self.labels.get(anchor.label, 0), anchor.occurrence)
+
+    def _find_labels(self, sheet) -> Dict[str, List[Tuple[int, int]]]:
+        found: Dict[str, List[Tuple[int, int]]] = {label: [] for label in self.labels}
+        remaining = len(self.labels)
+        if not remaining:
+            return found
+
+        for row_idx in range(sheet.nrows):
+            for col_idx, value in enumerate(sheet.row_values(row_idx)):
+                if not isinstance(value, str):
+                    continue
+                positions = found.get(value.strip())
+                if positions is None or len(positions) >= self.labels[value.strip()]:
+                    continue
+                positions.append((row_idx, col_idx))
+                if len(positions) == self.labels[value.strip()]:
+                    remaining -= 1
+                    if not remaining:
+                        return found
+        return found
+
+    def _cell(self, sheet, row: int, col: int, header: str) -> Any:
+        if row < 0 or row >= sheet.nrows or col < 0 or col >= sheet.ncols:
+            raise LayoutError(f"Cell ({row}, {col}) for column '{header}' is outside the sheet "
+                              f"({sheet.nrows} rows x {sheet.ncols} cols)")
+        return sheet.cell_value(row, col)
+
+    def run(self, sheet, filename_record: Optional[Any] = None) -> List[List[Any]]:
+        """
+        Extract the output rows of the model from a sheet.
+
+        Args:
+            sheet: xlrd sheet the model describes
+            filename_record: Utils.filename_parser.FilenameRecord for 'filename' columns
+
+        Returns:
+            List[List[Any]]: row_count rows, one value per header
+        """
+        anchors = self._find_labels(sheet)
+        rows = [[None] * len(self.columns) for _ in range(self.row_count)]
+
+        for col_idx, column in enumerate(self.columns):
+            values: List[Any] = []
+            locations: List[Optional[Location]] = []
+            for source in column.sources:
+                location = None
+                if column.kind == 'value':
+                    raw = source
+                elif column.kind == 'filename':
+                    if filename_record is None:
+                        raise LayoutError(f"Column '{column.header}' needs the parsed filename")
+                    raw = getattr(filename_record, source)
+                elif column.kind == 'cell':
+                    location = source
+                    raw = self._cell(sheet, source[0], source[1], column.header)
+                else:
+                    positions = anchors[source.label]
+                    if len(positions) < source.occurrence:
+                        raise LayoutError(f"Could not find occurrence {source.occurrence} of '{source.label}' "
+                                          f"in the sheet for column '{column.header}'")
+                    label_row, label_col = positions[source.occurrence - 1]
+                    location = (label_row + source.row_offset, label_col + source.col_offset)
+                    raw = self._cell(sheet, location[0], location[1], column.header)
+                values.append(raw)
+                locations.append(location)
+
+            try:
+                parsed = column.parser(values, locations)
+            except NumericParseError as e:
+                raise LayoutError(f"Column '{column.header}': {e}")
+            except (TypeError, ValueError) as e:
+                raise LayoutError(f"Could not parse column '{column.header}' with '{column.parser_name}': {e}")
+            for row_idx, value in enumerate(parsed):
+                rows[row_idx][col_idx] = value
+        return rows
+
+
+def _legacy_317_config(fields: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+    """Translate the original model_317.json (MONTO1/MONTO2/TARIFA1/...) into the declarative format."""
+    columns: List[Dict[str, Any]] = [
+        {"header": "IDD_CONCESION", "filename": "franchise"},
+        {"header": "IDD_OPERADOR", "filename": "operator"},
+        {"header": "Servicio", "filename": "rating_component"},
+        {"header": "Periodo", "filename": "period"},
+        {"header": "Mensajes", "anchor": {"label": "SUBTOTAL", "occurrences": [1, 2], "col_offset": 4}},
+    ]
+    for header, key, parser_name in LEGACY_317_FIELDS:
+        cells = [[fields[f"{key}{n}"]["row"], fields[f"{key}{n}"]["col"]] for n in (1, 2)]
+        columns.append({"header": header, "cells": cells, "parser": parser_name})
+    return {"sheet": 0, "output_sheet": "NovaAba", "rows": 2, "columns": columns}
+
+
+def compile_model(model: str, config: Dict[str, Any]) -> ExtractionPlan:
+    """
+    Compile a layout model configuration into an ExtractionPlan.
+
+    Each column has a "header", an optional "parser" (raw, text, amount, rate)
+    and exactly one source:
+      - "filename": FilenameRecord field, repeated on every row
+      - "value": constant, repeated on every row
+      - "cells": [[row, col], ...], one cell per output row
+      - "anchor": {"label", "occurrences": [n, ...], "row_offset", "col_offset"},
+        the nth occurrence of label, one occurrence per output row
+    """
+    if "columns" not in config and "MONTO1" in config:
+        config = _legacy_317_config(config)
+
+    try:
+        row_count = int(config.get("rows", 1))
+        columns = []
+        for column in config["columns"]:
+            header = column["header"]
+            parser_name = column.get("parser", "raw")
+            if "filename" in column:
+                columns.append(ColumnPlan(header, 'filename', [column["filename"]] * row_count, parser_name))
+            elif "value" in column:
+                columns.append(ColumnPlan(header, 'value', [column["value"]] * row_count, parser_name))
+            elif "cells" in column:
+                cells = [tuple(cell) for cell in column["cells"]]
+                if len(cells) != row_count:
+                    raise LayoutError(f"Column '{header}' has {len(cells)} cells for {row_count} rows")
+                columns.append(ColumnPlan(header, 'cell', cells, parser_name))
+            elif "anchor" in column:
+                anchor = column["anchor"]
+                occurrences = anchor.get("occurrences", list(range(1, row_count + 1)))
+                if len(occurrences) != row_count:
+                    raise LayoutError(f"Column '{header}' has {len(occurrences)} occurrences for {row_count} rows")
+                sources = [Anchor(anchor["label"], int(n), int(anchor.get("row_offset", 0)),
+                                  int(anchor.get("col_offset", 0))) for n in occurrences]
+                columns.append(ColumnPlan(header, 'anchor', sources, parser_name))
+            else:
+                raise LayoutError(f"Column '{header}' needs one of: filename, value, cells, anchor")
+    except KeyError as e:
+        raise LayoutError(f"Model '{model}' is missing required key {e}")
+
+    return ExtractionPlan(model, int(config.get("sheet", 0)), config.get("output_sheet", "NovaAba"),
+                          row_count, columns)
+
+
+@lru_cache(maxsize=None)
+def load_plan(model: str, models_dir: Path = LAYOUT_MODELS_DIR) -> ExtractionPlan:
+    """
+    Load layout_models/model_<model>.json and compile it, once per process.
+
+    The file holds {"<model>": {...}}, see compile_model for the format.
+    """
+    config_path = Path(models_dir) / f"model_{model}.json"
+    if not config_path.exists():
+        raise LayoutError(f"Layout model file not found: {config_path}")
+    with open(config_path, 'r', encoding='utf-8') as f:
+        model_config = json.load(f)
+
+    if model not in model_config:
+        raise LayoutError(f"Model '{model}' not found in configuration file {config_path}")
+
+    return compile_model(model, model_config[model])
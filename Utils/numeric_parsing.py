@@ -0,0 +1,171 @@
+import re
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+# (row, col) of a cell, 0-based as in xlrd
+Location = Tuple[int, int]
+
+KINDS = ('amount', 'rate')
+
+# Currency symbols and spaces (including non-breaking ones) carried by formatted cells
+_STRIP_TABLE = str.maketrans('', '', '$  \t')
+_NUMBER_RE = re.compile(r'^[+-]?(?:\d|[.,]\d)[\d.,]*$')
+_DOT_THOUSANDS_RE = re.compile(r'^\d{1,3}(?:\.\d{3})+$')
+_COMMA_THOUSANDS_RE = re.compile(r'^\d{1,3}(?:,\d{3})+$')
+
+
+def cell_name(row: int, col: int) -> str:
+    """Excel-style name of a 0-based cell, e.g. (10, 5) -> 'F11'."""
+    letters = ''
+    col += 1
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return f"{letters}{row + 1}"
+
+
+class NumericParseError(ValueError):
+    """Raised when a cell can't be read as a number; carries the cell location."""
+
+    def __init__(self, value: Any, kind: str, reason: str, location: Optional[Location] = None):
+        self.value = value
+        self.kind = kind
+        self.reason = reason
+        self.location = location
+        where = f" at {cell_name(*location)}" if location is not None else ""
+        super().__init__(f"Could not parse {value!r} as {kind}{where}: {reason}")
+
+
+@lru_cache(maxsize=4096)
+def _parse_text(text: str, kind: str) -> float:
+    """
+    Parse a Chilean/ES formatted number. Raises ValueError with the reason.
+
+    - '.' and ',' both present: the rightmost one is the decimal separator
+    - ',' alone: decimal separator ('0,0076')
+    - '.' repeated: thousands separator ('1.234.567')
+    - a single '.': thousands for amounts followed by exactly 3 digits ('1.234'),
+      decimal otherwise ('1234.5', and rates such as '0.0076')
+    """
+    cleaned = text.translate(_STRIP_TABLE)
+    negative = False
+    if cleaned.startswith('(') and cleaned.endswith(')'):
+        negative = True
+        cleaned = cleaned[1:-1]
+    if not cleaned:
+        raise ValueError("empty value")
+    if not _NUMBER_RE.match(cleaned):
+        raise ValueError("not a number")
+
+    sign = ''
+    if cleaned[0] in '+-':
+        sign, cleaned = cleaned[0], cleaned[1:]
+
+    dot = cleaned.rfind('.')
+    comma = cleaned.rfind(',')
+    if dot != -1 and comma != -1:
+        decimal, thousands = ('.', ',') if dot > comma else (',', '.')
+        integer, _, fraction = cleaned.rpartition(decimal)
+        if decimal in integer or thousands in fraction:
+            raise ValueError("misplaced separators")
+        if integer and not (integer.isdigit() or
+                            (_DOT_THOUSANDS_RE if thousands == '.' else _COMMA_THOUSANDS_RE).match(integer)):
+            raise ValueError("invalid thousands grouping")
+        number = f"{integer.replace(thousands, '')}.{fraction}"
+    elif comma != -1:
+        if cleaned.count(',') > 1:
+            if not _COMMA_THOUSANDS_RE.match(cleaned):
+                raise ValueError("more than one decimal comma")
+            number = cleaned.replace(',', '')
+        else:
+            number = cleaned.replace(',', '.')
+    elif dot != -1:
+        if cleaned.count('.') > 1 or (kind == 'amount' and _DOT_THOUSANDS_RE.match(cleaned)):
+            if not _DOT_THOUSANDS_RE.match(cleaned):
+                raise ValueError("invalid thousands grouping")
+            number = cleaned.replace('.', '')
+        else:
+            number = cleaned
+    else:
+        number = cleaned
+
+    value = float(sign + number)
+    return -value if negative else value
+
+
+def parse_number(value: Any, kind: str = 'amount', location: Optional[Location] = None) -> float:
+    """
+    Parse one cell value as a number.
+
+    Values xlrd already returns as numbers are used as they are; only text
+    cells go through the thousands/decimal rules.
+
+    >>> parse_number('1.234')
+    1234.0
+    >>> parse_number('1234.5')
+    1234.5
+    >>> parse_number('1,5')
+    1.5
+    >>> parse_number('1.234', 'rate')
+    1.234
+
+    Args:
+        value: Cell value
+        kind: 'amount' or 'rate', decides how a single '.' is read
+        location: (row, col) of the cell, reported in errors
+
+    Raises:
+        NumericParseError: If the value is not a number
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown numeric kind '{kind}'. Known: {KINDS}")
+    if isinstance(value, bool):
+        raise NumericParseError(value, kind, "boolean cell", location)
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        raise NumericParseError(value, kind, f"unsupported type {type(value).__name__}", location)
+    try:
+        return _parse_text(value.strip(), kind)
+    except ValueError as e:
+        raise NumericParseError(value, kind, str(e), location) from None
+
+
+def parse_column(values: Sequence[Any], kind: str = 'amount',
+                 locations: Optional[Sequence[Location]] = None) -> List[float]:
+    """
+    Parse a whole column of cell values at once.
+
+    Numeric cells are passed through without a function call per cell and
+    repeated text values are parsed once (see _parse_text's cache), which
+    keeps large batches of files cheap.
+
+    Args:
+        values: Cell values
+        kind: 'amount' or 'rate'
+        locations: (row, col) of each value, reported in errors
+
+    Raises:
+        NumericParseError: For the first value that is not a number
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown numeric kind '{kind}'. Known: {KINDS}")
+
+    parsed = []
+    append = parsed.append
+    for i, value in enumerate(values):
+        value_type = type(value)
+        if value_type is float or value_type is int:
+            append(float(value))
+            continue
+        location = locations[i] if locations is not None else None
+        append(parse_number(value, kind, location))
+    return parsed
+
+
+def parse_amounts(values: Iterable[Any], locations: Optional[Sequence[Location]] = None) -> List[float]:
+    return parse_column(list(values), 'amount', locations)
+
+
+def parse_rates(values: Iterable[Any], locations: Optional[Sequence[Location]] = None) -> List[float]:
+    return parse_column(list(values), 'rate', locations)
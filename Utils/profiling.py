@@ -0,0 +1,206 @@
+import argparse
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+PROFILE_DIR = Path(__file__).resolve().parent.parent / 'Logs' / 'profiles'
+PROFILE_MODES = ('cpu', 'mem')
+DEFAULT_TOP = 15
+
+
+def _safe_name(label: str) -> str:
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in label)[:120]
+
+
+class _Scope:
+    def __init__(self, label: str):
+        self.label = label
+        self.profile: Optional[cProfile.Profile] = None
+        self.children: List[pstats.Stats] = []
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+class Profiler:
+    """
+    Opt-in cProfile / tracemalloc capture for labelled scopes (a file, a stage).
+
+    Scopes nest: the outermost scope (usually one file) decides whether it is
+    sampled, with probability sample_rate, and every stage inside it is
+    captured too. In cpu mode each stage gets its own cProfile run while its
+    parent is paused, and the parent's report adds the stages back, so the
+    file-level report covers everything. In mem mode each scope compares
+    tracemalloc snapshots taken on entry and exit, and the outermost scope
+    also reports the peak. Reports go to Logs/profiles/ and the top-N
+    hotspots of the outermost scope are printed.
+
+    With mode None, or when a file is not sampled, a scope costs a
+    thread-local lookup.
+    """
+
+    def __init__(self, mode: Optional[str] = None, sample_rate: float = 1.0, top: int = DEFAULT_TOP,
+                 output_dir: Path = PROFILE_DIR):
+        self.configure(mode, sample_rate, top, output_dir)
+        self._local = threading.local()
+
+    def configure(self, mode: Optional[str] = None, sample_rate: float = 1.0, top: int = DEFAULT_TOP,
+                  output_dir: Path = PROFILE_DIR) -> None:
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'. Known: {PROFILE_MODES}")
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"Sample rate must be between 0 and 1, got {sample_rate}")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.top = top
+        self.output_dir = Path(output_dir)
+
+    def _stack(self) -> List[_Scope]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def context(self) -> List[Optional[_Scope]]:
+        """The scopes open in this thread, to continue them in worker threads with attach()."""
+        return list(self._stack())
+
+    @contextmanager
+    def attach(self, context: List[Optional[_Scope]]) -> Iterator[None]:
+        """
+        Nest the scopes a worker thread opens inside the scopes of context.
+
+        The worker's scopes are sampled with, and reported under, the thread
+        that submitted the work. A cProfile run only covers its own thread, so
+        the submitting thread's profiler is not paused; the worker's stats
+        are added to its report instead.
+        """
+        saved = getattr(self._local, 'stack', None), getattr(self._local, 'foreign', 0)
+        self._local.stack, self._local.foreign = list(context), len(context)
+        try:
+            yield
+        finally:
+            self._local.stack, self._local.foreign = saved
+
+    def _report_path(self, scope_labels: List[str], suffix: str) -> Path:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return self.output_dir / f"{stamp}_{_safe_name('.'.join(scope_labels))}{suffix}"
+
+    @contextmanager
+    def profile(self, label: str) -> Iterator[None]:
+        stack = self._stack()
+        outermost = not stack
+        if self.mode is None or (outermost and random.random() >= self.sample_rate) \
+                or (not outermost and stack[-1] is None):
+            # Not sampled: nested scopes see None and skip as well
+            stack.append(None)
+            try:
+                yield
+            finally:
+                stack.pop()
+            return
+
+        scope = _Scope(label)
+        labels = [s.label for s in stack] + [label]
+        # The parent runs in this thread, rather than in the thread this one was attached to
+        own_parent = len(stack) > getattr(self._local, 'foreign', 0)
+        started = time.perf_counter()
+        if self.mode == 'cpu':
+            if own_parent:
+                stack[-1].profile.disable()
+            scope.profile = cProfile.Profile()
+            stack.append(scope)
+            scope.profile.enable()
+        else:
+            started_tracing = False
+            if outermost and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            # reset_peak() is Python 3.9+; earlier versions report the peak since tracing started
+            if outermost and hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            scope.snapshot = tracemalloc.take_snapshot()
+            stack.append(scope)
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            if self.mode == 'cpu':
+                scope.profile.disable()
+                self._report_cpu(scope, labels, elapsed, stack[-1] if stack else None)
+                if own_parent:
+                    stack[-1].profile.enable()
+            else:
+                self._report_mem(scope, labels, elapsed, outermost)
+                if outermost and started_tracing:
+                    tracemalloc.stop()
+
+    def _report_cpu(self, scope: _Scope, labels: List[str], elapsed: float, parent: Optional[_Scope]) -> None:
+        stats = pstats.Stats(scope.profile)
+        for child in scope.children:
+            stats.add(child)
+        if parent is not None:
+            parent.children.append(stats)
+
+        path = self._report_path(labels, '.prof')
+        stats.dump_stats(str(path))
+
+        print(f"⏱️  CPU profile {'.'.join(labels)}: {elapsed:.3f}s, saved to {path}")
+        if parent is None:
+            # Hotspots are printed once per file; stage reports are in their own .prof files
+            buffer = io.StringIO()
+            pstats.Stats(str(path), stream=buffer).sort_stats('cumulative').print_stats(self.top)
+            print(buffer.getvalue().rstrip())
+
+    def _report_mem(self, scope: _Scope, labels: List[str], elapsed: float, outermost: bool) -> None:
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),))
+        differences = snapshot.compare_to(scope.snapshot, 'lineno')
+        current, peak = tracemalloc.get_traced_memory()
+
+        lines = [f"Memory profile {'.'.join(labels)}: {elapsed:.3f}s"]
+        if outermost:
+            lines.append(f"Peak traced memory: {peak / 1024:.1f} KiB, current: {current / 1024:.1f} KiB")
+        lines.append(f"Top {self.top} allocation changes by line:")
+        lines.extend(f"  {difference}" for difference in differences[:self.top])
+        report = '\n'.join(lines)
+
+        path = self._report_path(labels, '.mem.txt')
+        path.write_text(report + '\n', encoding='utf-8')
+        if outermost:
+            print(f"🧠 {report}\n   saved to {path}")
+        else:
+            print(f"🧠 Memory profile {'.'.join(labels)}: {elapsed:.3f}s, saved to {path}")
+
+
+PROFILER = Profiler()
+
+
+def profiled(label: str):
+    """Profile a block with the process-wide profiler, e.g. `with profiled('file.xls'):`."""
+    return PROFILER.profile(label)
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="Capture cProfile (cpu) or tracemalloc (mem) reports per file and stage under Logs/profiles/")
+    parser.add_argument("--profile-sample", type=float, default=1.0, metavar="RATE",
+                        help="Fraction of files to profile, e.g. 0.05 to keep it on in production (default: 1.0)")
+    parser.add_argument("--profile-top", type=int, default=DEFAULT_TOP, metavar="N",
+                        help=f"Number of hotspots printed per report (default: {DEFAULT_TOP})")
+
+
+def configure_from_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    try:
+        PROFILER.configure(args.profile, args.profile_sample, args.profile_top)
+    except ValueError as e:
+        parser.error(str(e))
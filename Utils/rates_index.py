@@ -0,0 +1,64 @@
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# Columns of rates_info_search.csv; rates_info_period.csv appends bp.fk_orga_oper
+RATES_COLUMNS = 13
+COL_RATING_COMPONENT = 2
+COL_COMPONENT_DIRECTION = 3
+COL_FK_ORGA_OPER = 13
+
+
+class RatesIndex:
+    """
+    In-memory index of prefetched rates_info_period.csv rows.
+
+    Rows are keyed by (franchise, period) and then by (operator, rating_component,
+    component_direction), so the rows rates_info_search.sql would return for a
+    query key are found with two dict lookups.
+    """
+
+    def __init__(self):
+        self._periods: Dict[Tuple[str, str], Dict[Tuple[str, str, str], List[str]]] = {}
+
+    def add_period(self, franchise: str, period: str, lines: List[str]) -> int:
+        """
+        Index the rows of one (franchise, period) prefetch.
+
+        Returns:
+            int: Number of rows indexed
+        """
+        index = self._periods.setdefault((franchise, period), {})
+        count = 0
+        for line in lines:
+            columns = line.rstrip('\n').split(',')
+            if len(columns) <= COL_FK_ORGA_OPER:
+                continue
+            key = (columns[COL_FK_ORGA_OPER].strip(),
+                   columns[COL_RATING_COMPONENT].strip(),
+                   columns[COL_COMPONENT_DIRECTION].strip())
+            # Drop the trailing fk_orga_oper so rows match rates_info_search.csv
+            index.setdefault(key, []).append(','.join(columns[:RATES_COLUMNS]))
+            count += 1
+        return count
+
+    def add_period_file(self, franchise: str, period: str, csv_file: Path) -> int:
+        with open(csv_file, 'r', encoding='utf-8') as f:
+            lines = [line for line in f if line.strip()]
+        return self.add_period(franchise, period, lines)
+
+    def has_period(self, franchise: str, period: str) -> bool:
+        return (franchise, period) in self._periods
+
+    def lookup(self, query_key: Tuple[str, str, str, str, str]) -> List[str]:
+        """
+        Return the rates_info_search.csv rows for a query key.
+
+        Args:
+            query_key: (franchise, operator, period, rating_component, component_direction)
+
+        Raises:
+            KeyError: If the (franchise, period) of the key was never prefetched
+        """
+        franchise, operator, period, rating_component, direction = query_key
+        index = self._periods[(franchise, period)]
+        return index.get((operator, rating_component, direction), [])
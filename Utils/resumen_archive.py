@@ -0,0 +1,217 @@
+import csv
+import gzip
+import os
+import socket
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+ARCHIVE_DIR = Path(__file__).resolve().parent.parent / 'Resumen_archive'
+
+KEY_COLUMNS = ['run_id', 'file_name', 'query_key', 'franchise', 'operator', 'period', 'rating_component',
+               'direction']
+# Resumen sheet columns, in sheet order
+ROW_COLUMNS = ['idd_concesion', 'idd_operador', 'servicio', 'periodo', 'tipo_tarifa', 'fecha_inicio',
+               'fecha_fin', 'tarifa', 'valor', 'cantidad']
+NUMERIC_COLUMNS = ('tarifa', 'valor', 'cantidad')
+COLUMNS = KEY_COLUMNS + ROW_COLUMNS
+
+PARQUET_SUFFIX = '.parquet'
+CSV_SUFFIX = '.csv.gz'
+
+
+def _to_float(value: str) -> Optional[float]:
+    # Values come from the DB as plain decimals ('0.0076'), unlike the ES-formatted sheet cells
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _pyarrow():
+    """Return (pyarrow, pyarrow.parquet), or None when the optional dependency is not installed."""
+    try:
+        import pyarrow
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    return pyarrow, pq
+
+
+def new_run_id() -> str:
+    """Sortable id of a run, unique across hosts and processes, e.g. 20251008T182417_host_1234."""
+    host = ''.join(c if c.isalnum() or c in '-_' else '_' for c in socket.gethostname())
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{host}_{os.getpid()}"
+
+
+class ArchiveWriter:
+    """
+    Collects the Resumen rows of one run and appends them to the archive.
+
+    Rows are buffered in memory and written by flush() as one new part file
+    per period, so parts are never rewritten and several nodes can append to
+    the same archive at once. Parts are Parquet when pyarrow is installed
+    and gzip-compressed CSV otherwise; readers handle both.
+    """
+
+    def __init__(self, root: Path = ARCHIVE_DIR, run_id: Optional[str] = None):
+        self.root = Path(root)
+        self.run_id = run_id or new_run_id()
+        self._rows: Dict[str, List[Dict[str, Any]]] = {}
+        self._parts = 0
+        self._lock = threading.Lock()
+
+    def add(self, file_name: str, query_key: Sequence[str], rows: Iterable[Sequence[str]]) -> int:
+        """Buffer the Resumen rows written to file_name; returns the number of rows added."""
+        franchise, operator, period, rating_component, direction = query_key
+        base = {'run_id': self.run_id, 'file_name': file_name, 'query_key': '_'.join(query_key),
+                'franchise': franchise, 'operator': operator, 'period': period,
+                'rating_component': rating_component, 'direction': direction}
+        records = []
+        for row in rows:
+            record = dict(base)
+            for position, column in enumerate(ROW_COLUMNS):
+                value = row[position] if position < len(row) else ''
+                record[column] = _to_float(value) if column in NUMERIC_COLUMNS else value
+            records.append(record)
+        with self._lock:
+            self._rows.setdefault(period, []).extend(records)
+        return len(records)
+
+    def flush(self) -> List[Path]:
+        """Write the buffered rows as one part per period; returns the part files written."""
+        with self._lock:
+            buffered, self._rows = self._rows, {}
+        modules = _pyarrow() if buffered else None
+        written = []
+        for period, records in sorted(buffered.items()):
+            partition = self.root / f"period={period}"
+            partition.mkdir(parents=True, exist_ok=True)
+            self._parts += 1
+            suffix = PARQUET_SUFFIX if modules else CSV_SUFFIX
+            path = partition / f"part-{self.run_id}-{self._parts:04d}{suffix}"
+            # Written under a dot name and renamed, so readers never see a partial part
+            tmp_path = partition / f".{path.name}.tmp"
+            if modules:
+                pyarrow, pq = modules
+                pq.write_table(pyarrow.Table.from_pylist(records), str(tmp_path), compression='zstd')
+            else:
+                with gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as f:
+                    writer = csv.DictWriter(f, fieldnames=COLUMNS)
+                    writer.writeheader()
+                    writer.writerows(records)
+            os.replace(tmp_path, path)
+            written.append(path)
+        if written:
+            print(f"🗄️  Archived {sum(len(r) for r in buffered.values())} resumen rows in {len(written)} parts "
+                  f"under {self.root}")
+        return written
+
+
+class ResumenArchive:
+    """
+    Read side of the archive: filters rows by partition and aggregates them.
+
+    Period filters prune whole partition directories before any file is
+    opened. With latest_only, only the rows of the most recent part of each
+    file are kept, ordered by run id and then by the part's sequence number,
+    so re-running a period, or reprocessing a file within one watch session,
+    does not count its rows twice.
+    """
+
+    def __init__(self, root: Path = ARCHIVE_DIR):
+        self.root = Path(root)
+
+    def periods(self) -> List[str]:
+        if not self.root.is_dir():
+            return []
+        return sorted(path.name.split('=', 1)[1] for path in self.root.glob('period=*') if path.is_dir())
+
+    def _parts(self, periods: Optional[Iterable[str]]) -> Iterator[Path]:
+        wanted = set(periods) if periods is not None else None
+        for period in self.periods():
+            if wanted is not None and period not in wanted:
+                continue
+            for path in sorted((self.root / f"period={period}").glob('part-*')):
+                if path.name.endswith((PARQUET_SUFFIX, CSV_SUFFIX)):
+                    yield path
+
+    @staticmethod
+    def _part_order(path: Path, run_id: str) -> Tuple[str, int]:
+        """(run id, sequence) of a part-<run_id>-NNNN file; later parts of a run sort after earlier ones."""
+        name = path.name[:-len(PARQUET_SUFFIX if path.name.endswith(PARQUET_SUFFIX) else CSV_SUFFIX)]
+        return run_id, int(name.rsplit('-', 1)[1])
+
+    @staticmethod
+    def _read_part(path: Path) -> Iterator[Dict[str, Any]]:
+        if path.name.endswith(PARQUET_SUFFIX):
+            modules = _pyarrow()
+            if modules is None:
+                raise RuntimeError(f"{path} is a Parquet part; install pyarrow to read it")
+            yield from modules[1].read_table(str(path)).to_pylist()
+            return
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            for record in csv.DictReader(f):
+                for column in NUMERIC_COLUMNS:
+                    record[column] = _to_float(record[column])
+                yield record
+
+    def rows(self, periods: Optional[Iterable[str]] = None, latest_only: bool = True,
+             **filters: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yield archived rows as dicts, e.g. rows(periods=['202509'], operator='407').
+
+        Args:
+            periods: Partitions to read; all of them when None
+            latest_only: Keep only the rows of the latest part written for each file
+            **filters: Column values rows must equal
+        """
+        unknown = set(filters) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown archive columns: {sorted(unknown)}. Known: {COLUMNS}")
+
+        def matches(record: Dict[str, Any]) -> bool:
+            return all(str(record[column]) == str(value) for column, value in filters.items())
+
+        if not latest_only:
+            for path in self._parts(periods):
+                yield from filter(matches, self._read_part(path))
+            return
+        # Run ids start with their timestamp, so the greatest (run id, sequence) is the latest part.
+        # It is picked before filtering, so a filter never brings back rows of an older part
+        latest: Dict[str, Tuple[Tuple[str, int], List[Dict[str, Any]]]] = {}
+        for path in self._parts(periods):
+            for record in self._read_part(path):
+                order = self._part_order(path, record['run_id'])
+                kept_order, kept = latest.get(record['file_name'], (('', -1), []))
+                if order > kept_order:
+                    latest[record['file_name']] = (order, [record])
+                elif order == kept_order:
+                    kept.append(record)
+        for _, kept in latest.values():
+            yield from filter(matches, kept)
+
+    def aggregate(self, by: Sequence[str] = ('idd_operador', 'servicio', 'periodo'), value: str = 'valor',
+                  periods: Optional[Iterable[str]] = None, latest_only: bool = True,
+                  **filters: str) -> List[Tuple[Tuple[str, ...], float, int]]:
+        """
+        Sum a numeric column grouped by other columns.
+
+        Returns:
+            List[Tuple[Tuple[str, ...], float, int]]: (group values, sum, row count), sorted by group
+        """
+        unknown = set(by) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown archive columns: {sorted(unknown)}. Known: {COLUMNS}")
+        if value not in NUMERIC_COLUMNS:
+            raise ValueError(f"Can only aggregate {NUMERIC_COLUMNS}, got '{value}'")
+
+        totals: Dict[Tuple[str, ...], List[float]] = {}
+        for record in self.rows(periods, latest_only, **filters):
+            group = tuple(str(record[column]) for column in by)
+            total = totals.setdefault(group, [0.0, 0])
+            if record[value] is not None:
+                total[0] += record[value]
+            total[1] += 1
+        return [(group, total, int(count)) for group, (total, count) in sorted(totals.items())]
@@ -0,0 +1,102 @@
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+# Hidden sheet holding the stamp of the data written to the Resumen sheet
+METADATA_SHEET = '_resumen_meta'
+# Bump when the canonical form changes, so older stamps are never trusted
+DIGEST_VERSION = '1'
+
+FIELD_SEP = '\x1f'
+ROW_SEP = '\x1e'
+
+
+def canonical_value(value: Any) -> str:
+    """Render a cell value the same way whether it comes from resumen.txt or back from xlrd."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def resumen_digest(rows: Iterable[Sequence[Any]], width: int) -> str:
+    """
+    SHA-256 of the first width columns of every row, in order.
+
+    Rows are padded to width, so a row read back from the sheet, whose
+    trailing blank cells xlrd may drop, hashes like the row that was written.
+    """
+    digest = hashlib.sha256(DIGEST_VERSION.encode('utf-8'))
+    for row in rows:
+        values = [canonical_value(value) for value in row[:width]]
+        values.extend([''] * (width - len(values)))
+        digest.update(FIELD_SEP.join(values).encode('utf-8'))
+        digest.update(ROW_SEP.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def sheet_digest(sheet, width: int) -> str:
+    """Digest of an existing xlrd Resumen sheet, skipping its header row."""
+    return resumen_digest((sheet.row_values(row, 0, min(width, sheet.ncols)) for row in range(1, sheet.nrows)), width)
+
+
+def build_stamp(digest: str, row_count: int, params: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    stamp = {'version': DIGEST_VERSION, 'digest': digest, 'rows': str(row_count)}
+    for name, value in sorted((params or {}).items()):
+        stamp[f'param.{name}'] = str(value)
+    stamp['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return stamp
+
+
+def read_stamp(book) -> Optional[Dict[str, str]]:
+    """Return the key/value stamp of an xlrd workbook, or None if it has no metadata sheet."""
+    if METADATA_SHEET not in book.sheet_names():
+        return None
+    sheet = book.sheet_by_name(METADATA_SHEET)
+    if sheet.ncols < 2:
+        return {}
+    return {canonical_value(sheet.cell_value(row, 0)): canonical_value(sheet.cell_value(row, 1))
+            for row in range(sheet.nrows)}
+
+
+def stamp_matches(stamp: Dict[str, str], expected: Dict[str, str]) -> bool:
+    """True when two stamps describe the same data and query parameters; the timestamp is ignored."""
+    def comparable(values: Dict[str, str]) -> Dict[str, str]:
+        return {key: value for key, value in values.items() if key != 'updated_at'}
+    return comparable(stamp) == comparable(expected)
+
+
+def write_stamp(wb, stamp: Dict[str, str]) -> None:
+    """Add the stamp to an xlwt workbook as a hidden two-column sheet."""
+    sheet = wb.add_sheet(METADATA_SHEET)
+    for row, (key, value) in enumerate(stamp.items()):
+        sheet.write(row, 0, key)
+        sheet.write(row, 1, value)
+    # BOUNDSHEET visibility: 0 visible, 1 hidden
+    sheet.visibility = 1
+
+
+def unchanged_reason(book, digest: str, row_count: int, params: Optional[Dict[str, str]],
+                     width: int) -> Optional[str]:
+    """
+    Tell whether an xlrd workbook already holds this Resumen data.
+
+    The metadata stamp is checked first, since it is a few cells; workbooks
+    written before stamps existed have their Resumen sheet hashed instead.
+
+    Returns:
+        Optional[str]: Why the write can be skipped, or None when the sheet must be rewritten
+    """
+    if 'Resumen' not in book.sheet_names():
+        return None
+
+    stamp = read_stamp(book)
+    if stamp is not None:
+        if stamp_matches(stamp, build_stamp(digest, row_count, params)):
+            return "metadata stamp matches"
+        return None
+
+    if sheet_digest(book.sheet_by_name('Resumen'), width) == digest:
+        return "existing Resumen rows match"
+    return None
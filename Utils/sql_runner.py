@@ -0,0 +1,390 @@
+import atexit
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from Utils.concurrency import LIMITER
+from Utils.env import load_env
+from Utils.metrics import DB_QUERY_ERRORS, DB_QUERY_SECONDS, DB_ROWS
+
+SQL_DIR = Path(__file__).resolve().parent.parent / 'SQL_files'
+
+QUERY_TIMEOUT = 900
+CONNECT_TIMEOUT = 60
+
+# Every value is sent on one sqlplus stdin line and fits a VARCHAR2(4000) bind
+MAX_PARAM_LENGTH = 4000
+CONTROL_CHAR_RE = re.compile(r'[\x00-\x1f\x7f]')
+# Unquoted placeholders are pasted into the SQL text, so their values are restricted to
+# the characters of ids, periods and rates; quoted ones take any text, with quotes escaped
+UNQUOTED_PARAM_RE = re.compile(r'^[A-Za-z0-9_.:+\-]*$')
+PLACEHOLDER_RE = re.compile(r'&(\d+)')
+# Quoted placeholders ('&3') are string literals, so they can become bind variables (:p3) as they are
+QUOTED_PLACEHOLDER_RE = re.compile(r"'&(\d+)'")
+BIND_TYPE = 'VARCHAR2(4000)'
+# Statements SQL*Plus keeps parsed per session, on top of the server's cursor sharing
+STATEMENT_CACHE_SIZE = 20
+# Lines removed from the templates: results come back on stdout, not through spool files
+STRIPPED_LINE_RE = re.compile(r'^\s*(spool\b.*|set\s+termout\s+\w+\s*;?|exit\s*;?)\s*$', re.IGNORECASE)
+ERROR_LINE_RE = re.compile(r'^((ORA|SP2|TNS)-\d+|ERROR at line \d+)')
+
+
+class SqlRunnerError(RuntimeError):
+    """Raised when a query can't be rendered or sqlplus fails to run it."""
+
+
+class QueryResult(NamedTuple):
+    rows: List[str]
+    errors: List[str]
+
+    @property
+    def success(self) -> bool:
+        return not self.errors
+
+
+def quote_literal(value: str) -> str:
+    """SQL string literal of a value, e.g. O'Higgins -> 'O''Higgins'."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+class SqlTemplate:
+    """
+    A SQL_files script loaded once, with its spool and exit commands removed.
+
+    bound_body is the same script with every quoted placeholder ('&N')
+    replaced by the bind variable :pN. Its text doesn't depend on the
+    arguments, so Oracle parses it once and shares the cursor across calls
+    instead of hard-parsing a new literal text for every argument set.
+    """
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.body = '\n'.join(line for line in text.splitlines() if not STRIPPED_LINE_RE.match(line))
+        self.arg_count = max((int(n) for n in PLACEHOLDER_RE.findall(self.body)), default=0)
+        self.bound_body = QUOTED_PLACEHOLDER_RE.sub(lambda match: f":p{match.group(1)}", self.body)
+        self.bind_positions = sorted({int(n) for n in QUOTED_PLACEHOLDER_RE.findall(self.body)})
+
+    def _values(self, args: Sequence[str]) -> List[str]:
+        if len(args) < self.arg_count:
+            raise SqlRunnerError(f"{self.name} needs {self.arg_count} arguments, got {len(args)}")
+        values = [str(arg).strip() for arg in args]
+        for position, value in enumerate(values, start=1):
+            if len(value) > MAX_PARAM_LENGTH or CONTROL_CHAR_RE.search(value):
+                raise SqlRunnerError(f"Invalid value for &{position} of {self.name}: {value!r}")
+        return values
+
+    def _substitute_unquoted(self, body: str, values: List[str]) -> str:
+        def value(match: 're.Match[str]') -> str:
+            position = int(match.group(1))
+            if not UNQUOTED_PARAM_RE.match(values[position - 1]):
+                raise SqlRunnerError(f"Invalid value for unquoted &{position} of {self.name}: "
+                                     f"{values[position - 1]!r}")
+            return values[position - 1]
+        return PLACEHOLDER_RE.sub(value, body)
+
+    def render(self, args: Sequence[str]) -> str:
+        """
+        Substitute &1..&N with validated arguments, as literals.
+
+        Raises:
+            SqlRunnerError: If the argument count or an argument value is invalid
+        """
+        values = self._values(args)
+        body = QUOTED_PLACEHOLDER_RE.sub(lambda match: quote_literal(values[int(match.group(1)) - 1]), self.body)
+        return self._substitute_unquoted(body, values)
+
+    def bind(self, args: Sequence[str]) -> Tuple[str, Dict[str, str]]:
+        """
+        Return the bound statement and its bind values, e.g. {'p1': '317'}.
+
+        Unquoted placeholders, if a script has any, are still substituted as text.
+
+        Raises:
+            SqlRunnerError: If the argument count or an argument value is invalid
+        """
+        values = self._values(args)
+        sql = self._substitute_unquoted(self.bound_body, values)
+        return sql, {f"p{position}": values[position - 1] for position in self.bind_positions}
+
+
+@lru_cache(maxsize=None)
+def load_template(name: str) -> SqlTemplate:
+    path = SQL_DIR / name
+    if not path.exists():
+        raise SqlRunnerError(f"Local SQL not found: {path}")
+    return SqlTemplate(name, path.read_text(encoding='utf-8'))
+
+
+class SqlPlusSession:
+    """
+    One long-lived `sqlplus -s /nolog` process driven over stdin.
+
+    CONNECT is sent over stdin, so credentials never appear in the process
+    list. Every query is wrapped in PROMPT markers with a unique token and its
+    output is read from stdout up to the closing marker; ORA-/SP2-/TNS- lines
+    in between are reported as errors.
+
+    Bind values are set with VARIABLE ... = value (SQL*Plus 12.2+), which
+    SQL*Plus handles itself, so the only text the database parses is the
+    bound statement. SET STATEMENTCACHE keeps those statements parsed on the
+    client side of the session as well.
+    """
+
+    def __init__(self, connect_string: str):
+        self._process = subprocess.Popen(
+            ['sqlplus', '-s', '/nolog'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace', cwd=SQL_DIR)
+        self._lines: 'queue.Queue[Optional[str]]' = queue.Queue()
+        self._reader = threading.Thread(target=self._read_stdout, daemon=True)
+        self._reader.start()
+
+        # Values are already substituted, so '&' in a value must not start a substitution variable
+        result = self._run(f"CONNECT {connect_string}\nSET DEFINE OFF\nSET STATEMENTCACHE {STATEMENT_CACHE_SIZE}",
+                           CONNECT_TIMEOUT)
+        if not result.success:
+            self.close()
+            raise SqlRunnerError(f"Could not connect: {' '.join(result.errors)}")
+
+    def _read_stdout(self) -> None:
+        for line in self._process.stdout:
+            self._lines.put(line.rstrip('\n'))
+        self._lines.put(None)
+
+    @property
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    def _run(self, script: str, timeout: float) -> QueryResult:
+        token = uuid.uuid4().hex
+        begin, end = f"__BEGIN_{token}__", f"__END_{token}__"
+        try:
+            self._process.stdin.write(f"PROMPT {begin}\n{script}\nPROMPT {end}\n")
+            self._process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise SqlRunnerError(f"sqlplus is not running: {e}")
+
+        rows: List[str] = []
+        errors: List[str] = []
+        started = False
+        # One deadline for the whole script, so a query that keeps printing still times out
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self._lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                # The query is still running, so sqlplus wouldn't read an exit command
+                self._process.kill()
+                raise SqlRunnerError(f"sqlplus did not answer within {timeout} seconds")
+            if line is None:
+                raise SqlRunnerError(f"sqlplus exited with status {self._process.poll()}")
+            if line == begin:
+                started = True
+            elif line == end:
+                return QueryResult(rows, errors)
+            elif started and line.strip():
+                if ERROR_LINE_RE.match(line.strip()):
+                    errors.append(line.strip())
+                else:
+                    rows.append(line)
+
+    def execute(self, sql: str, binds: Optional[Dict[str, str]] = None,
+                timeout: float = QUERY_TIMEOUT) -> QueryResult:
+        """Run a rendered script, after setting its bind variables, and return its output rows and error lines."""
+        # Values have no line breaks (SqlTemplate._values); quotes are escaped in the literal
+        variables = ''.join(f"VARIABLE {name} {BIND_TYPE} = {quote_literal(value)}\n"
+                            for name, value in (binds or {}).items())
+        return self._run(variables + sql, timeout)
+
+    def close(self) -> None:
+        if self._process.poll() is None:
+            try:
+                self._process.stdin.write("exit\n")
+                self._process.stdin.flush()
+                self._process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.kill()
+
+
+class RecordingSession:
+    """
+    Stand-in for SqlPlusSession that records what would reach the database.
+
+    Each execute() appends (sql, binds) to its recorder and answers with the
+    recorder's responder, so a whole run can be driven without Oracle to check,
+    for example, how many distinct SQL texts it sends.
+    """
+
+    alive = True
+
+    def __init__(self, recorder: 'SqlRecorder'):
+        self._recorder = recorder
+
+    def execute(self, sql: str, binds: Optional[Dict[str, str]] = None,
+                timeout: float = QUERY_TIMEOUT) -> QueryResult:
+        with self._recorder.lock:
+            self._recorder.statements.append((sql, dict(binds or {})))
+        return QueryResult(list(self._recorder.responder(sql, binds or {})), [])
+
+    def close(self) -> None:
+        pass
+
+
+class SqlRecorder:
+    """Session factory for SessionPool that hands out RecordingSessions sharing one statement log."""
+
+    def __init__(self, responder: Optional[Callable[[str, Dict[str, str]], Sequence[str]]] = None):
+        self.responder = responder or (lambda sql, binds: [])
+        self.statements: List[Tuple[str, Dict[str, str]]] = []
+        self.lock = threading.Lock()
+
+    def __call__(self) -> RecordingSession:
+        return RecordingSession(self)
+
+    def distinct_texts(self) -> int:
+        return len({sql for sql, _ in self.statements})
+
+
+class SessionPool:
+    """
+    Reuse up to `size` connected sqlplus sessions across queries and threads.
+
+    Without a size the pool follows the adaptive limiter's ceiling, so it never
+    holds more sessions than queries the limiter can admit. A factory, such as
+    a SqlRecorder, replaces the sqlplus sessions.
+    """
+
+    def __init__(self, size: Optional[int] = None, factory: Optional[Callable[[], SqlPlusSession]] = None):
+        self._size = size
+        self._factory = factory
+        self._idle: List[SqlPlusSession] = []
+        self._created = 0
+        self._condition = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        return self._size if self._size is not None else LIMITER.ceiling
+
+    @staticmethod
+    def _connect_string() -> str:
+        load_env()
+        username = os.getenv("SQL_USERNAME")
+        password = os.getenv("SQL_PASSWORD")
+        database = os.getenv("SQL_DATABASE")
+        if not username or not password or not database:
+            raise SqlRunnerError("Set SQL_USERNAME, SQL_PASSWORD and SQL_DATABASE in config/.env")
+        return f"{username}/{password}@{database}"
+
+    @contextmanager
+    def session(self) -> Iterator[SqlPlusSession]:
+        with self._condition:
+            while not self._idle and self._created >= self.size:
+                self._condition.wait()
+            session = self._idle.pop() if self._idle else None
+            if session is None:
+                self._created += 1
+
+        try:
+            if session is None or not session.alive:
+                session = self._factory() if self._factory else SqlPlusSession(self._connect_string())
+        except BaseException:
+            with self._condition:
+                self._created -= 1
+                self._condition.notify()
+            raise
+
+        try:
+            yield session
+        except SqlRunnerError:
+            # The session may be left mid-query; don't hand it out again
+            session.close()
+            session = None
+            raise
+        finally:
+            with self._condition:
+                if session is not None and session.alive:
+                    self._idle.append(session)
+                else:
+                    self._created -= 1
+                self._condition.notify()
+
+    def close(self) -> None:
+        with self._condition:
+            for session in self._idle:
+                session.close()
+            self._created -= len(self._idle)
+            self._idle.clear()
+
+
+POOL = SessionPool()
+atexit.register(POOL.close)
+
+
+def bind_variables_enabled() -> bool:
+    """Bind variables are on unless SQL_BIND_VARIABLES=0, e.g. for a SQL*Plus client older than 12.2."""
+    load_env()
+    return os.getenv("SQL_BIND_VARIABLES", "1").strip() != "0"
+
+
+def run_query(sql_name: str, output_name: Optional[str] = None, args: Sequence[str] = (),
+              output_dir: Optional[Path] = None) -> Tuple[bool, str, str, int]:
+    """
+    Run a SQL_files script through the session pool.
+
+    The rows are written to <output_dir>/<output_name> for the stages that
+    read them from there, in the format the script used to spool.
+
+    Args:
+        sql_name: Script file name under SQL_files
+        output_name: File name the rows are written to
+        args: Positional substitution arguments (&1, &2, ...)
+        output_dir: Directory of output_name, the job workspace; defaults to SQL_files
+
+    Returns:
+        Tuple[bool, str, str, int]: (success, stdout, stderr, exit_code)
+    """
+    try:
+        template = load_template(sql_name)
+        if bind_variables_enabled():
+            sql, binds = template.bind(args)
+        else:
+            sql, binds = template.render(args), {}
+        print(f"Executing {sql_name} with arguments: {' '.join(str(arg) for arg in args)}", flush=True)
+        with LIMITER.slot(sql_name) as slot, POOL.session() as session:
+            # Only the query is timed; spawning and connecting a new session is not query latency
+            with slot.timed(), DB_QUERY_SECONDS.time(template=sql_name):
+                result = session.execute(sql, binds)
+            if not result.success:
+                slot.mark_error()
+    except SqlRunnerError as e:
+        DB_QUERY_ERRORS.inc(template=sql_name)
+        error_msg = f"ERROR: {e}"
+        print(error_msg)
+        return False, "", error_msg, 1
+
+    DB_ROWS.inc(len(result.rows), template=sql_name)
+    if not result.success:
+        DB_QUERY_ERRORS.inc(template=sql_name)
+
+    out = '\n'.join(result.rows)
+    err = '\n'.join(result.errors)
+    if err:
+        print("--- SQL ERRORS ---")
+        print(err)
+
+    if output_name is not None and result.success:
+        output_file = Path(output_dir or SQL_DIR) / output_name
+        tmp_file = output_file.with_name(f"{output_name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.writelines(row + '\n' for row in result.rows)
+        os.replace(tmp_file, output_file)
+        print(f"Wrote {len(result.rows)} rows to {output_file}")
+
+    return result.success, out, err, 0 if result.success else 1
@@ -1,7 +1,7 @@
-import xlwt
-
 def create_table_styles():
     """Create and return table styles for headers and data cells"""
+    import xlwt
+    
     # Create styles for table formatting
     header_style = xlwt.XFStyle()
     header_font = xlwt.Font()
@@ -0,0 +1,213 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+DEFAULT_LEASE_SECONDS = 300
+# Claims of a key, including the first; failed and expired keys are retried until then
+DEFAULT_MAX_ATTEMPTS = 3
+LEDGER_FILE_NAME = '.add_sheet_ledger.sqlite'
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA_VERSION = 2
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Parse an 'i/N' shard spec (1-based), e.g. '2/3'.
+
+    Raises:
+        ValueError: If the spec is malformed or i is not in 1..N
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected i/N such as 1/3")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{value}', i must be between 1 and N")
+    return index, count
+
+
+def shard_of(key: str, count: int) -> int:
+    """Stable 1-based shard of a work key; the same on every host and Python version."""
+    return zlib.crc32(key.encode('utf-8')) % count + 1
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkLedger:
+    """
+    Lease-based work ledger in a SQLite file shared by several workers.
+
+    Each work key (a query group) is claimed by one owner for lease_seconds.
+    Owners extend their lease with heartbeat() while they work and finish it
+    with done() or failed(). A lease that expires, because its node crashed,
+    and a key that failed can be claimed again by any worker, up to
+    max_attempts claims in all, so every key is finished exactly once as long
+    as workers keep heartbeating.
+
+    Keys belong to an epoch, one run over the directory. register() joins the
+    latest epoch while it still has work left, so nodes started together
+    share it, and opens a new epoch once everything in it is finished. A
+    later run therefore processes every group again, including groups that
+    new or reissued files have joined since.
+
+    Claims run inside BEGIN IMMEDIATE transactions, which serialise writers
+    through SQLite's file lock. A rollback journal is used instead of WAL, as
+    WAL needs shared memory that network shares don't provide.
+    """
+
+    def __init__(self, path: Path, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 owner: Optional[str] = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.owner = owner or default_owner()
+        self.max_attempts = max_attempts
+        self.epoch = 0
+        with self._connect() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                # Ledgers written before epochs only hold state of finished runs
+                conn.execute("DROP TABLE IF EXISTS work")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS work ("
+                " epoch INTEGER NOT NULL,"
+                " key TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " owner TEXT,"
+                " lease_until REAL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " updated REAL NOT NULL,"
+                " PRIMARY KEY (epoch, key))")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per operation, so heartbeat threads and
+        # other processes never share a connection
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def register(self, keys: Iterable[str]) -> int:
+        """
+        Add keys as pending to the current epoch, opening a new one if the latest is finished.
+
+        Keys already in the epoch keep their state.
+
+        Returns:
+            int: The epoch joined
+        """
+        now = time.time()
+        with self._connect() as conn:
+            latest = conn.execute("SELECT MAX(epoch) FROM work").fetchone()[0]
+            if latest is None:
+                self.epoch = 1
+            elif conn.execute(
+                    "SELECT 1 FROM work WHERE epoch = ? AND (status = ? OR (status = ? AND lease_until >= ?)"
+                    " OR ((status = ? OR (status = ? AND lease_until < ?)) AND attempts < ?)) LIMIT 1",
+                    (latest, PENDING, LEASED, now, FAILED, LEASED, now, self.max_attempts)).fetchone():
+                # Work left: pending keys, live leases, or failed and expired keys with attempts left
+                self.epoch = latest
+            else:
+                self.epoch = latest + 1
+            conn.executemany("INSERT OR IGNORE INTO work (epoch, key, status, updated) VALUES (?, ?, ?, ?)",
+                             [(self.epoch, key, PENDING, now) for key in keys])
+        return self.epoch
+
+    def claim(self, candidates: Sequence[str]) -> Optional[str]:
+        """
+        Lease the first candidate that is pending, failed or whose lease has expired.
+
+        Failed and expired keys are only claimed again while they have attempts left.
+
+        Returns:
+            Optional[str]: The claimed key, or None when no candidate is available
+        """
+        if not candidates:
+            return None
+        now = time.time()
+        with self._connect() as conn:
+            placeholders = ','.join('?' * len(candidates))
+            rows = conn.execute(
+                f"SELECT key, status, attempts FROM work WHERE epoch = ? AND key IN ({placeholders})"
+                f" AND (status = ? OR ((status = ? OR (status = ? AND lease_until < ?)) AND attempts < ?))",
+                [self.epoch, *candidates, PENDING, FAILED, LEASED, now, self.max_attempts]).fetchall()
+            available = {key: (status, attempts) for key, status, attempts in rows}
+            for key in candidates:
+                if key in available:
+                    status, attempts = available[key]
+                    if status == LEASED:
+                        print(f"♻️  Reclaiming expired lease on {key}")
+                    elif status == FAILED:
+                        print(f"🔁 Retrying {key} (attempt {attempts + 1} of {self.max_attempts})")
+                    conn.execute(
+                        "UPDATE work SET status = ?, owner = ?, lease_until = ?, attempts = attempts + 1,"
+                        " updated = ? WHERE epoch = ? AND key = ?",
+                        (LEASED, self.owner, now + self.lease_seconds, now, self.epoch, key))
+                    return key
+        return None
+
+    def _finish(self, key: str, status: str, lease_until: Optional[float]) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE work SET status = ?, lease_until = ?, updated = ?"
+                " WHERE epoch = ? AND key = ? AND owner = ? AND status = ?",
+                (status, lease_until, now, self.epoch, key, self.owner, LEASED))
+            return cursor.rowcount == 1
+
+    def heartbeat(self, key: str) -> bool:
+        """Extend the lease on key. Returns False if this owner no longer holds it."""
+        return self._finish(key, LEASED, time.time() + self.lease_seconds)
+
+    def done(self, key: str) -> bool:
+        """Record key as done. Returns False if this owner no longer held the lease."""
+        return self._finish(key, DONE, None)
+
+    def failed(self, key: str) -> bool:
+        """Record key as failed, to be retried. Returns False if this owner no longer held the lease."""
+        return self._finish(key, FAILED, None)
+
+    @contextmanager
+    def hold(self, key: str) -> Iterator[None]:
+        """Heartbeat the lease on key from a background thread while the block runs."""
+        stop = threading.Event()
+
+        def beat() -> None:
+            while not stop.wait(self.lease_seconds / 3):
+                if not self.heartbeat(key):
+                    print(f"⚠️  Lost the lease on {key}")
+                    return
+
+        thread = threading.Thread(target=beat, name=f"lease-{key}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM work WHERE epoch = ? GROUP BY status",
+                                     (self.epoch,)).fetchall())
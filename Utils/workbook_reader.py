@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+
+
+@contextmanager
+def open_workbook_readonly(file_path: str, formatting_info: bool = False):
+    """
+    Open an .xls file for reading only what is needed.
+
+    The file is memory-mapped and sheets are parsed on demand, so
+    book.sheet_names() costs only the workbook globals and
+    book.sheet_by_index(0) parses the records of the first sheet alone.
+    Formatting records are skipped unless formatting_info is set. Use the
+    regular xlrd.open_workbook(formatting_info=True) path only when the
+    workbook is going to be copied and rewritten.
+
+    Yields:
+        xlrd.Book: The workbook; its resources are released on exit
+    """
+    import xlrd
+
+    book = xlrd.open_workbook(file_path, on_demand=True, use_mmap=True, formatting_info=formatting_info)
+    try:
+        yield book
+    finally:
+        book.release_resources()
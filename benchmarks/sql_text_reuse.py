@@ -0,0 +1,65 @@
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from Utils import sql_runner  # noqa: E402
+from Utils.sql_runner import SessionPool, SqlRecorder, load_template, run_query  # noqa: E402
+
+
+def simulate_run(groups: int, lines: int, work_dir: Path) -> List[Tuple[str, List[str]]]:
+    """
+    Issue the queries of a run with `groups` query groups of `lines` rates lines each.
+
+    Returns:
+        List[Tuple[str, List[str]]]: (template, arguments) of every query issued
+    """
+    calls = []
+
+    def query(name: str, output_name: str, args: List[str]) -> None:
+        calls.append((name, args))
+        run_query(name, output_name, args, work_dir)
+
+    query('billing_periods.sql', 'billing_periods.csv', ['317', '202509', '202509'])
+    for group in range(groups):
+        operator = str(100 + group)
+        query('rates_info_search.sql', 'rates_info_search.csv', ['317', operator, '202509', 'TBAJ', 'I'])
+        for line in range(lines):
+            query('generate_resumen_infos.sql', 'generate_resumen_infos.csv',
+                  ['PROD', f"T{line}", '317', operator, 'TBAJ', '01-SEP-25', 'I', '30-SEP-25', 'NOR',
+                   f".{76 + line:04d}", '202509'])
+    return calls
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Count the distinct SQL texts a run sends, using a recording stand-in for sqlplus.")
+    parser.add_argument("--groups", type=int, default=20, help="Query groups in the simulated run")
+    parser.add_argument("--lines", type=int, default=10, help="Rates lines, i.e. resumen queries, per group")
+    args = parser.parse_args()
+
+    recorder = SqlRecorder()
+    sql_runner.POOL = SessionPool(factory=recorder)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        calls = simulate_run(args.groups, args.lines, Path(tmp_dir))
+
+    templates = {name for name, _ in calls}
+    literal_texts = {load_template(name).render(call_args) for name, call_args in calls}
+
+    print(f"\n=== {len(recorder.statements)} statements sent for {args.groups} groups x {args.lines} lines ===")
+    print(f"  distinct SQL texts with bind variables: {recorder.distinct_texts()}")
+    print(f"  distinct SQL texts with literal substitution: {len(literal_texts)}")
+    if recorder.distinct_texts() <= len(templates):
+        print(f"  ✅ one SQL text per template ({len(templates)} templates)")
+        return 0
+    print(f"  ❌ expected at most {len(templates)} SQL texts, one per template")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import argparse
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that quick checks (--help, --dry-run) should never load
+HEAVY_MODULES = ('xlrd', 'xlwt', 'xlutils', 'dotenv')
+
+SAMPLE_FILES = [
+    "317_114_AIRTIME_TECHNOLOGIES_CHILE_SPA_202509_TALT_R_I_20251008_182417.xls",
+    "317_114_AIRTIME_TECHNOLOGIES_CHILE_SPA_202509_TALT_R_I_20251009_090000.xls",
+    "215_123_123_ENTEL_CHILE_S.A._202509_CLDI_R_I_236_20251008_120252.xls",
+]
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Parse `-X importtime` output into (module, self_us, cumulative_us) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append((module.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(args: List[str]) -> List[Tuple[str, int, int]]:
+    cmd = [sys.executable, '-X', 'importtime', str(REPO_ROOT / 'main.py')] + args
+    result = subprocess.run(cmd, capture_output=True, text=True, cwd=str(REPO_ROOT))
+    return parse_importtime(result.stderr)
+
+
+def report(name: str, rows: List[Tuple[str, int, int]], top: int) -> bool:
+    total_ms = sum(self_us for _, self_us, _ in rows) / 1000
+    loaded = {module.strip() for module, _, _ in rows}
+    heavy = sorted(m for m in loaded if m.split('.')[0] in HEAVY_MODULES)
+
+    print(f"\n=== {name}: {len(rows)} modules, {total_ms:.1f} ms total import time ===")
+    top_level = sorted((r for r in rows if not r[0].startswith('  ')), key=lambda r: r[2], reverse=True)
+    for module, _, cumulative_us in top_level[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {module.strip()}")
+    if heavy:
+        print(f"  ❌ heavy modules imported: {', '.join(heavy)}")
+    else:
+        print("  ✅ no Excel/DB modules imported")
+    return not heavy
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure main.py startup import time with -X importtime.")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest top-level imports to show")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in SAMPLE_FILES:
+            (Path(tmp_dir) / name).touch()
+
+        ok = report("main.py --help", measure(['--help']), args.top)
+        ok = report("main.py --dry-run", measure(['--dry-run', tmp_dir]), args.top) and ok
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
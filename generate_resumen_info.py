@@ -1,38 +1,28 @@
 import os
 import sys
 from pathlib import Path
-import subprocess
-from dotenv import load_dotenv
 from typing import Tuple, Optional
+from Utils.sql_runner import run_query
 
-# Load .env
-ENV_PATH = Path(__file__).parent / "config" / ".env"
-if ENV_PATH.exists():
-    load_dotenv(str(ENV_PATH))
-
-def generate_resumen_info(line_number: int) -> Tuple[bool, str, str, int]:
+def generate_resumen_info(line_number: int, work_dir: Optional[Path] = None,
+                          output_name: str = "generate_resumen_infos.csv") -> Tuple[bool, str, str, int]:
     """
     Execute generate resumen info by reading parameters from rates_info_search.csv.
-    Reads the specified line from rates_info_search.csv and extracts 10 parameters.
+    Reads the specified line from rates_info_search.csv and extracts 11 parameters.
     
     Args:
         line_number: Line number to read from rates_info_search.csv (1-based)
+        work_dir: Job workspace holding rates_info_search.csv, where generate_resumen_infos.csv
+                  is written; defaults to SQL_files
+        output_name: File the rows are written to, so lines running at the same time don't share one
     
     Returns:
         Tuple[bool, str, str, int]: (success, stdout, stderr, exit_code)
     """
-    # Read DB connection parts (user/password@ALIAS_TNS)
-    SQL_USERNAME = os.getenv("SQL_USERNAME")
-    SQL_PASSWORD = os.getenv("SQL_PASSWORD")
-    SQL_DATABASE = os.getenv("SQL_DATABASE")
-
-    # Validate required vars
-    if not SQL_USERNAME or not SQL_PASSWORD or not SQL_DATABASE:
-        return False, "", "ERROR: Set SQL_USERNAME, SQL_PASSWORD and SQL_DATABASE in config/.env", 1
-
     # Paths
     LOCAL_SQL = Path(__file__).parent / "SQL_files" / "generate_resumen_infos.sql"
-    RATES_FILE = Path(__file__).parent / "SQL_files" / "rates_info_search.csv"
+    OUTPUT_DIR = Path(work_dir) if work_dir is not None else Path(__file__).parent / "SQL_files"
+    RATES_FILE = OUTPUT_DIR / "rates_info_search.csv"
 
     if not LOCAL_SQL.exists():
         return False, "", f"ERROR: Local SQL not found: {LOCAL_SQL}", 1
@@ -56,7 +46,7 @@ def generate_resumen_info(line_number: int) -> Tuple[bool, str, str, int]:
             if not target_line:
                 return False, "", f"ERROR: Line {line_number} is empty", 1
             
-            # Split by comma and extract 10 parameters
+            # Split by comma and extract 11 parameters
             columns = target_line.split(',')
             if len(columns) < 11:
                 return False, "", f"ERROR: Line {line_number} does not have enough columns. Expected at least 11, got {len(columns)}", 1
@@ -72,6 +62,7 @@ def generate_resumen_info(line_number: int) -> Tuple[bool, str, str, int]:
             arg8 = columns[5].strip()   # coluna 6 (index 5)
             arg9 = columns[9].strip()   # coluna 10 (index 9)
             arg10 = columns[10].strip() # coluna 11 (index 10)
+            arg11 = columns[6].strip()  # coluna 7 (index 6), bp.name, so the query needs no date conversion
             
             print(f"Extracted parameters from line {line_number} of rates file:")
             print(f"  arg1 (col8): {arg1}")
@@ -84,46 +75,11 @@ def generate_resumen_info(line_number: int) -> Tuple[bool, str, str, int]:
             print(f"  arg8 (col6): {arg8}")
             print(f"  arg9 (col10): {arg9}")
             print(f"  arg10 (col11): {arg10}")
+            print(f"  arg11 (col7): {arg11}")
 
-        # Build connection string and run sqlplus locally
-        conn = f"{SQL_USERNAME}/{SQL_PASSWORD}@{SQL_DATABASE}"
-        sql_dir = LOCAL_SQL.parent
-        sql_file = LOCAL_SQL.name
-        connection_string = f'cd "{sql_dir}" && sqlplus -s {conn} @{sql_file} {arg1} {arg2} {arg3} {arg4} {arg5} {arg6} {arg7} {arg8} {arg9} {arg10}'
-        print(f"Executing command: {connection_string}", flush=True)
-        
-        # Execute sqlplus locally using subprocess
-        result = subprocess.run(connection_string, shell=True, capture_output=True, text=True, timeout=900)
-        out = result.stdout.rstrip()
-        err = result.stderr.rstrip()
-        exit_code = result.returncode
-
-        print("SQL*Plus exit status:", exit_code)
-        if out:
-            print("--- STDOUT ---")
-            print(out)
-        if err:
-            print("--- STDERR ---")
-            print(err)
-
-        # Clean up the output file - remove empty lines
-        output_file = sql_dir / "generate_resumen_infos.csv"
-        if output_file.exists():
-            try:
-                with open(output_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                
-                # Remove empty lines and write back
-                cleaned_lines = [line for line in lines if line.strip()]
-                
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.writelines(cleaned_lines)
-                    
-                print(f"Cleaned output file: {output_file}")
-            except Exception as cleanup_error:
-                print(f"Warning: Could not clean output file: {cleanup_error}")
-
-        return exit_code == 0, out, err, exit_code
+        # Rows come back over the pooled sqlplus session and are written to generate_resumen_infos.csv
+        return run_query("generate_resumen_infos.sql", output_name,
+                         [arg1, arg2, arg3, arg4, arg5, arg6, arg7, arg8, arg9, arg10, arg11], OUTPUT_DIR)
         
     except Exception as e:
         error_msg = f"ERROR: {e}"
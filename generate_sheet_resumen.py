@@ -1,13 +1,32 @@
 import os
 import sys
-import shutil
+import argparse
 from pathlib import Path
-from typing import Tuple, List
-import xlrd
-from xlutils.copy import copy
-import xlwt
+from typing import Iterable, Tuple, List, Optional, Sequence
 import logging
 from datetime import datetime
+from Utils.column_widths import WidthTrackingWriter
+from Utils.backup_store import BackupStore
+from Utils.atomic_save import atomic_save
+from Utils.workbook_reader import open_workbook_readonly
+from Utils.billing_calendar import BillingCalendar, resumen_sort_key
+from Utils.profiling import add_profile_arguments, configure_from_args, profiled
+from Utils.metrics import FILES, RESUMEN_ROWS
+from Utils.resumen_archive import ArchiveWriter
+from Utils.resumen_digest import METADATA_SHEET, build_stamp, resumen_digest, unchanged_reason, write_stamp
+
+BACKUP_STORE = BackupStore(Path(__file__).parent / 'Backup_files')
+
+# An .xls sheet holds at most 65,536 rows; longer resumens continue on Resumen_2, Resumen_3, ...
+XLS_MAX_ROWS = 65536
+RESUMEN_INDEX_SHEET = 'Resumen_index'
+# Rows kept in memory per sheet before they are serialised with flush_row_data()
+FLUSH_EVERY = 1000
+
+RESUMEN_HEADERS = [
+    'IDD_CONCESION', 'IDD_OPERADOR', 'SERVICIO', 'PERIODO', 'TIPO_TARIFA', 'FECHA_INICIO', 
+    'FECHA_FIN', 'TARIFA', 'VALOR', 'CANTIDAD'
+]
 
 def setup_logging():
     """
@@ -33,12 +52,15 @@ def setup_logging():
     
     return logging.getLogger(__name__)
 
-def read_resumen_data(resumen_file: str) -> Tuple[bool, str, List[List[str]]]:
+def read_resumen_data(resumen_file: str, calendar: Optional[BillingCalendar] = None,
+                      query_key: Optional[Sequence[str]] = None) -> Tuple[bool, str, List[List[str]]]:
     """
     Read and parse the resumen.txt file.
     
     Args:
         resumen_file: Path to resumen.txt file
+        calendar: Billing period windows used to fill blank FED/LED values and order the rows
+        query_key: Query parameters the rows came from; its franchise and fk_orga_oper select the calendar windows
         
     Returns:
         Tuple[bool, str, List[List[str]]]: (success, error_message, parsed_data)
@@ -80,18 +102,17 @@ def read_resumen_data(resumen_file: str) -> Tuple[bool, str, List[List[str]]]:
         if original_count != len(unique_data):
             print(f"🗑️  Removed {original_count - len(unique_data)} duplicate lines")
         
-        # Sort by FED (column 6) and time_premium (column 7) - assuming these are the date columns
-        # FED appears to be column 6 (FECHA_INICIO) and time_premium column 7 (FECHA_FIN)
-        def sort_key(row):
-            if len(row) >= 8:
-                # Extract date parts for sorting (assuming DD-MMM-YY format)
-                try:
-                    fed = row[6] if len(row) > 6 else ""
-                    time_premium = row[7] if len(row) > 7 else ""
-                    return (fed, time_premium)
-                except:
-                    return ("", "")
-            return ("", "")
+        # Sort by FED (column 6), LED (column 7) and time_premium (column 5), comparing the dates as dates
+        sort_key = resumen_sort_key
+        
+        # Fill blank rate windows (FED/LED) from the billing period calendar, and group the
+        # rows of a split period by the billing window they fall in
+        if calendar is not None and query_key:
+            franchise, operator = query_key[0], query_key[1]
+            filled = sum(calendar.fill_rate_window(franchise, operator, row) for row in unique_data)
+            if filled:
+                print(f"📅 Filled FED/LED of {filled} lines from the billing period calendar")
+            sort_key = calendar.sort_key(franchise, operator)
         
         unique_data.sort(key=sort_key)
         
@@ -112,22 +133,40 @@ def read_resumen_data(resumen_file: str) -> Tuple[bool, str, List[List[str]]]:
     except Exception as e:
         return False, f"ERROR reading resumen.txt: {e}", []
 
-def create_resumen_sheet(wb, parsed_data: List[List[str]]) -> None:
+def resumen_sheet_name(page: int) -> str:
+    """Name of a Resumen page: 'Resumen', then 'Resumen_2', 'Resumen_3', ..."""
+    return 'Resumen' if page == 1 else f'Resumen_{page}'
+
+def is_resumen_sheet(name: str) -> bool:
+    """True for the sheets this script writes: Resumen pages, their index and the hidden stamp."""
+    if name in ('Resumen', RESUMEN_INDEX_SHEET, METADATA_SHEET):
+        return True
+    prefix, _, page = name.partition('_')
+    return prefix == 'Resumen' and page.isdigit() and int(page) >= 2
+
+def create_resumen_sheet(wb, parsed_data: Iterable[List[str]],
+                         rows_per_sheet: int = XLS_MAX_ROWS - 1) -> List[Tuple[str, int, int]]:
     """
-    Create a new sheet with resumen data.
+    Write the resumen rows to as many Resumen sheets as needed.
+    
+    An .xls sheet holds at most 65,536 rows, so after rows_per_sheet data rows
+    the writer rolls over to Resumen_2, Resumen_3, ..., each with the header
+    and its own column widths. Rows are streamed: every FLUSH_EVERY rows they
+    are serialised with flush_row_data(), so memory stays bounded however many
+    rows are written. When more than one sheet is needed, a Resumen_index sheet
+    lists the data rows held by each one.
     
     Args:
         wb: Excel workbook object
-        parsed_data: Parsed data from resumen.txt
+        parsed_data: Parsed data from resumen.txt, in order
+        rows_per_sheet: Data rows per sheet, below the header
+        
+    Returns:
+        List[Tuple[str, int, int]]: (sheet_name, first_row, last_row) per sheet, 1-based data row numbers
     """
-    # Create new sheet
-    sheet = wb.add_sheet('Resumen', cell_overwrite_ok=True)
+    import xlwt
     
-    # Define headers based on the data structure
-    headers = [
-        'IDD_CONCESION', 'IDD_OPERADOR', 'SERVICIO', 'PERIODO', 'TIPO_TARIFA', 'FECHA_INICIO', 
-        'FECHA_FIN', 'TARIFA', 'VALOR', 'CANTIDAD'
-    ]
+    headers = RESUMEN_HEADERS
     
     # Create header style
     header_style = xlwt.easyxf(
@@ -143,39 +182,66 @@ def create_resumen_sheet(wb, parsed_data: List[List[str]]) -> None:
         'align: vert center'
     )
     
-    # Write headers
-    for col, header in enumerate(headers):
-        sheet.write(0, col, header, header_style)
+    pages = []
+    writer = None
+    sheet_row = 0
+    
+    def finish_page() -> None:
+        # Set column widths from the widest value written in each column, then release the rows
+        writer.apply_widths()
+        writer.sheet.flush_row_data()
     
-    # Write data
-    for row_idx, row_data in enumerate(parsed_data, start=1):
-        for col_idx, value in enumerate(row_data):
-            if col_idx < len(headers):  # Ensure we don't exceed header count
-                sheet.write(row_idx, col_idx, value, data_style)
+    for row_number, row_data in enumerate(parsed_data, start=1):
+        if writer is None or sheet_row > rows_per_sheet:
+            if writer is not None:
+                finish_page()
+            # Create new sheet and write headers; widths are tracked while writing
+            sheet = wb.add_sheet(resumen_sheet_name(len(pages) + 1), cell_overwrite_ok=True)
+            writer = WidthTrackingWriter(sheet)
+            writer.write_row(0, headers, header_style)
+            pages.append([sheet.name, row_number, row_number])
+            sheet_row = 1
+        
+        # Ensure we don't exceed header count
+        writer.write_row(sheet_row, row_data[:len(headers)], data_style)
+        pages[-1][2] = row_number
+        sheet_row += 1
+        if sheet_row % FLUSH_EVERY == 0:
+            writer.sheet.flush_row_data()
+    
+    if writer is None:
+        # No rows: keep the header-only sheet
+        writer = WidthTrackingWriter(wb.add_sheet('Resumen', cell_overwrite_ok=True))
+        writer.write_row(0, headers, header_style)
+    finish_page()
     
-    # Set appropriate column widths to ensure visibility
-    column_widths = [
-        2000,  # IDD_CONCESION
-        2000,  # IDD_OPERADOR
-        3000,  # SERVICIO
-        2000,  # PERIODO
-        2000,  # TIPO_TARIFA
-        2500,  # FECHA_INICIO
-        2500,  # FECHA_FIN
-        2000,  # TARIFA
-        3000,  # VALOR
-        2000   # CANTIDAD
-    ]
+    if len(pages) > 1:
+        index_writer = WidthTrackingWriter(wb.add_sheet(RESUMEN_INDEX_SHEET))
+        index_writer.write_row(0, ['HOJA', 'FILA_INICIO', 'FILA_FIN', 'FILAS'], header_style)
+        for index_row, (name, first, last) in enumerate(pages, start=1):
+            index_writer.write_row(index_row, [name, first, last, last - first + 1], data_style)
+        index_writer.apply_widths()
+        print(f"📑 Resumen split across {len(pages)} sheets, listed in {RESUMEN_INDEX_SHEET}")
     
-    for col, width in enumerate(column_widths):
-        sheet.col(col).width = width
+    return [tuple(page) for page in pages]
 
-def generate_sheet_resumen(xls_file_path: str) -> Tuple[bool, str]:
+def generate_sheet_resumen(xls_file_path: str, calendar: Optional[BillingCalendar] = None,
+                           work_dir: Optional[Path] = None,
+                           query_key: Optional[Sequence[str]] = None,
+                           archive: Optional[ArchiveWriter] = None) -> Tuple[bool, str]:
     """
     Generate a new sheet in the Excel file with resumen data.
     
+    The data hash and query parameters are stamped in a hidden metadata sheet.
+    When the workbook already holds the same rows for the same parameters, it
+    is left untouched: no backup, copy or save.
+    
     Args:
         xls_file_path: Path to the original Excel file
+        calendar: Billing period windows used to fill blank FED/LED values and order the rows
+        work_dir: Job workspace holding resumen.txt; defaults to the project directory
+        query_key: Query parameters the rows came from, recorded in the stamp
+        archive: Run's archive writer; rows written to the sheet are added to it, tagged with the file name and query_key
         
     Returns:
         Tuple[bool, str]: (success, error_message)
@@ -183,15 +249,23 @@ def generate_sheet_resumen(xls_file_path: str) -> Tuple[bool, str]:
     logger = setup_logging()
     
     try:
+        # Excel libraries are only imported once a workbook is actually processed
+        import xlrd
+        import xlwt
+        from xlutils.copy import copy
+        
         # Validate input file
         if not os.path.exists(xls_file_path):
+            FILES.inc(stage='resumen', result='failed')
             return False, f"ERROR: Excel file not found: {xls_file_path}"
         
         # Read resumen data
-        resumen_file = os.path.join(os.path.dirname(__file__), 'resumen.txt')
-        success, message, parsed_data = read_resumen_data(resumen_file)
+        resumen_file = os.path.join(work_dir or os.path.dirname(__file__), 'resumen.txt')
+        with profiled("read_resumen"):
+            success, message, parsed_data = read_resumen_data(resumen_file, calendar, query_key)
         
         if not success:
+            FILES.inc(stage='resumen', result='failed')
             return False, message
         
         print(f"📊 {message}")
@@ -199,80 +273,93 @@ def generate_sheet_resumen(xls_file_path: str) -> Tuple[bool, str]:
         # Get filename for backup operations
         filename = os.path.basename(xls_file_path)
         
-        # Create backup directory
-        backup_dir = os.path.join(os.path.dirname(__file__), 'Backup_files')
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        
-        # Check if Resumen sheet already exists first
-        rb_check = xlrd.open_workbook(xls_file_path, formatting_info=True)
-        sheet_names = [sheet.name for sheet in rb_check.sheets()]
-        
-        if 'Resumen' in sheet_names:
-            print("⚠️  Sheet 'Resumen' already exists. Creating backup and removing Resumen sheet...")
-            # Create backup with same name as original file (with Resumen)
-            backup_file = os.path.join(backup_dir, filename)
-            shutil.copy2(xls_file_path, backup_file)
-            print(f"💾 Backup created: {backup_file}")
-            
-            # Create new workbook with only original sheets (excluding Resumen)
-            new_wb = xlwt.Workbook()
-            for sheet in rb_check.sheets():
-                if sheet.name != 'Resumen':
-                    # Copy sheet data to new workbook
-                    new_sheet = new_wb.add_sheet(sheet.name)
-                    for row in range(sheet.nrows):
-                        for col in range(sheet.ncols):
-                            try:
-                                cell_value = sheet.cell(row, col).value
-                                new_sheet.write(row, col, cell_value)
-                            except:
-                                pass
+        params = {'query_key': '_'.join(query_key)} if query_key else None
+        digest = resumen_digest(parsed_data, len(RESUMEN_HEADERS))
+        
+        # Check if Resumen sheet already exists first and whether it holds these rows;
+        # only the globals and the sheets that are looked at are parsed
+        with profiled("compare"), open_workbook_readonly(xls_file_path) as book:
+            sheet_names = book.sheet_names()
+            unchanged = unchanged_reason(book, digest, len(parsed_data), params, len(RESUMEN_HEADERS))
+        
+        if unchanged:
+            print(f"⏭️  Resumen sheet of {filename} is up to date ({unchanged}), skipping the write")
+            FILES.inc(stage='resumen', result='unchanged')
+            # The archive already holds these rows from the run that wrote them
+            return True, f"Resumen sheet already up to date with {len(parsed_data)} rows"
+        
+        # Back up the file before any modification; identical content is stored only once
+        with profiled("backup"):
+            BACKUP_STORE.backup(xls_file_path)
+        
+        if any(is_resumen_sheet(name) for name in sheet_names):
+            print("⚠️  Sheet 'Resumen' already exists. Removing Resumen sheet...")
+            with profiled("remove_resumen"):
+                # Only cell values are copied below, so formatting records are not needed
+                rb_check = xlrd.open_workbook(xls_file_path)
+                
+                # Create new workbook with only original sheets (excluding the Resumen pages and their stamp)
+                new_wb = xlwt.Workbook()
+                for sheet in rb_check.sheets():
+                    if not is_resumen_sheet(sheet.name):
+                        # Copy sheet data to new workbook
+                        new_sheet = new_wb.add_sheet(sheet.name)
+                        for row in range(sheet.nrows):
+                            for col in range(sheet.ncols):
+                                try:
+                                    cell_value = sheet.cell(row, col).value
+                                    new_sheet.write(row, col, cell_value)
+                                except:
+                                    pass
             
             # Save the new workbook
-            new_wb.save(xls_file_path)
+            atomic_save(new_wb, xls_file_path)
             print("📄 Created new workbook without Resumen sheet")
-        else:
-            # No Resumen sheet exists, create backup of original file
-            backup_file = os.path.join(backup_dir, filename)
-            shutil.copy2(xls_file_path, backup_file)
-            print(f"💾 Backup created: {backup_file}")
         
         # Open workbook
         print(f"📖 Opening Excel file: {xls_file_path}")
-        rb = xlrd.open_workbook(xls_file_path, formatting_info=True)
-        wb = copy(rb)
+        with profiled("copy"):
+            rb = xlrd.open_workbook(xls_file_path, formatting_info=True)
+            wb = copy(rb)
         
         # Create resumen sheet
         print("📝 Creating Resumen sheet...")
-        create_resumen_sheet(wb, parsed_data)
+        with profiled("write"):
+            pages = create_resumen_sheet(wb, parsed_data)
+            write_stamp(wb, build_stamp(digest, len(parsed_data), params))
         
         # Save the workbook
         print("💾 Saving Excel file...")
-        wb.save(xls_file_path)
+        with profiled("save"):
+            atomic_save(wb, xls_file_path)
         
         print(f"✅ Successfully added Resumen sheet to {filename}")
-        print(f"📊 Added {len(parsed_data)} data rows to the sheet")
+        print(f"📊 Added {len(parsed_data)} data rows to {len(pages)} sheet{'s' if len(pages) > 1 else ''}")
+        FILES.inc(stage='resumen', result='processed')
+        RESUMEN_ROWS.observe(len(parsed_data))
+        if archive is not None and query_key:
+            archive.add(filename, query_key, parsed_data)
         
         return True, f"Successfully added Resumen sheet with {len(parsed_data)} rows"
         
     except Exception as e:
         error_msg = f"ERROR: {e}"
         logger.error(error_msg)
+        FILES.inc(stage='resumen', result='failed')
         return False, error_msg
 
 if __name__ == "__main__":
-    # Check if file path is provided as command line argument
-    if len(sys.argv) < 2:
-        print("ERROR: Please provide Excel file path as argument")
-        print("Usage: python generate_sheet_resumen.py <excel_file_path>")
-        print("Example: python generate_sheet_resumen.py ./Liquidation_files/317_114_AIRTIME_TECHNOLOGIES_CHILE_SPA_202509_TALT_R_I_20251008_182417.xls")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Add the Resumen sheet built from resumen.txt to an Excel file.")
+    parser.add_argument("xls_file_path", help="Excel file, e.g. ./Liquidation_files/317_114_AIRTIME_TECHNOLOGIES_CHILE_SPA_202509_TALT_R_I_20251008_182417.xls")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(parser, args)
     
-    xls_file_path = sys.argv[1]
+    xls_file_path = args.xls_file_path
     
     print("🚀 Starting resumen sheet generation...")
-    success, message = generate_sheet_resumen(xls_file_path)
+    with profiled(os.path.basename(xls_file_path)):
+        success, message = generate_sheet_resumen(xls_file_path)
     
     if success:
         print(f"\n🎉 {message}")
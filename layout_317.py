@@ -1,12 +1,23 @@
-import xlrd
-from xlutils.copy import copy
-import xlwt
-import shutil
 import os
-import json
+import sys
+import glob
+import time
+import argparse
 import logging
 from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple
 from Utils.table_styles import create_table_styles
+from Utils.column_widths import WidthTrackingWriter
+from Utils.filename_parser import FilenameError, parse_filename
+from Utils.backup_store import BackupStore
+from Utils.atomic_save import atomic_save
+from Utils.workbook_reader import open_workbook_readonly
+from Utils.layout_engine import load_plan
+from Utils.profiling import PROFILER, add_profile_arguments, configure_from_args, profiled
+from Utils.metrics import FILES
+
+BACKUP_STORE = BackupStore(os.path.join(os.path.dirname(__file__), 'Backup_files'))
 
 def setup_logging():
     """
@@ -32,194 +43,100 @@ def setup_logging():
     
     return logging.getLogger(__name__)
 
-def extract_filename_data(filename):
-    """
-    Extract data from filename based on the expected format.
-    
-    Args:
-        filename (str): The filename to parse
-        
-    Returns:
-        dict: Dictionary containing extracted data
-    """
-    filename_parts = filename.split('_')
-    
-    if len(filename_parts) < 8:
-        raise ValueError(f"The filename format is not valid, please check README.md file for the correct format: {filename}")
-    
-    return {
-        'IDD_CONCESION': filename_parts[1],
-        'IDD_OPERADOR': filename_parts[0],
-        'PERIODO': filename_parts[3],
-        'SERVICIO': filename_parts[4]
-    }
+class LayoutResult(NamedTuple):
+    """Outcome of one file: status is 'added', 'skipped' or 'failed'."""
+    file: str
+    status: str
+    rows: int
+    seconds: float
+    message: str
 
-def find_subtotal_values(sheet):
+@lru_cache(maxsize=None)
+def shared_state(modelo):
     """
-    Find MENSAJES1 and MENSAJES2 by locating the first two occurrences of "SUBTOTAL"
-    and taking the value 4 cells ahead.
-    
-    Args:
-        sheet: Excel sheet object
-        
-    Returns:
-        tuple: (MENSAJES1, MENSAJES2)
+    State every file of a model shares, built once per process: the error
+    logger, the compiled extraction plan and the table styles.
     """
-    mensajes1 = None
-    mensajes2 = None
-    subtotal_count = 0
-    
-    for row_idx in range(sheet.nrows):
-        for col_idx in range(sheet.ncols):
-            cell_value = str(sheet.cell_value(row_idx, col_idx)).strip()
-            if cell_value == "SUBTOTAL":
-                subtotal_count += 1
-                if subtotal_count == 1:
-                    # First occurrence - get value 4 cells ahead
-                    if col_idx + 4 < sheet.ncols:
-                        mensajes1 = sheet.cell_value(row_idx, col_idx + 4)
-                elif subtotal_count == 2:
-                    # Second occurrence - get value 4 cells ahead
-                    if col_idx + 4 < sheet.ncols:
-                        mensajes2 = sheet.cell_value(row_idx, col_idx + 4)
-                    break
-    
-    if mensajes1 is None or mensajes2 is None:
-        raise ValueError("Could not find two occurrences of 'SUBTOTAL' in the sheet")
-    
-    return mensajes1, mensajes2
+    return setup_logging(), load_plan(modelo), create_table_styles()
 
-def layout_317(arquivo, modelo):
+def _process_file(arquivo, modelo, backup=True):
     """
-    Add a resume sheet to an Excel file based on the 317 model.
+    Add the model's sheet to one file and describe the outcome.
+    
+    The workbook is parsed once, with formatting, on demand: a file that
+    already has the output sheet costs only the workbook globals, and the
+    same parse feeds the extraction and the copy that is written back.
     
     Args:
         arquivo (str): Path to the Excel file
-        modelo (str): Model name (should be '317')
+        modelo (str): Model name, e.g. '317'
+        backup (bool): Back up the file before saving; batch runs back up in the parent process
+        
+    Returns:
+        LayoutResult: Outcome of the file
     """
-    # Setup logging
-    logger = setup_logging()
+    started = time.perf_counter()
+    logger, plan, (header_style, data_style) = shared_state(modelo)
     
     try:
-        # Extract data from filename
-        filename = os.path.basename(arquivo)
-        filename_data = extract_filename_data(filename)
-        print(f"Extracted from filename - IDD_CONCESION: {filename_data['IDD_CONCESION']}, "
-              f"IDD_OPERADOR: {filename_data['IDD_OPERADOR']}, "
-              f"PERIODO: {filename_data['PERIODO']}, "
-              f"SERVICIO: {filename_data['SERVICIO']}")
-        
-        # Load configuration
-        config_path = os.path.join(os.path.dirname(__file__), 'layout_models', 'model_317.json')
-        with open(config_path, 'r') as f:
-            model_config = json.load(f)
-        
-        if modelo not in model_config:
-            raise ValueError(f"Model '{modelo}' not found in configuration file")
-        
-        model_fields = model_config[modelo]
-        
-        # Create backup in Backup_files directory
-        backup_dir = os.path.join(os.path.dirname(__file__), 'Backup_files')
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
+        # Excel libraries are only imported once a workbook is actually processed
+        from xlutils.copy import copy
         
+        # Extract data from filename
         filename = os.path.basename(arquivo)
-        backup_filename = filename.replace('.xls', '_backup.xls').replace('.xlsx', '_backup.xlsx')
-        backup_file = os.path.join(backup_dir, backup_filename)
-        shutil.copy2(arquivo, backup_file)
-        print(f"Backup created: {backup_file}")
+        try:
+            filename_record = parse_filename(filename)
+        except FilenameError as e:
+            raise ValueError(f"The filename format is not valid, please check README.md file for the correct format: {e}")
+        print(f"Extracted from filename - IDD_CONCESION: {filename_record.franchise}, "
+              f"IDD_OPERADOR: {filename_record.operator}, "
+              f"PERIODO: {filename_record.period}, "
+              f"SERVICIO: {filename_record.rating_component}")
         
-        # Open workbook
-        rb = xlrd.open_workbook(arquivo, formatting_info=True)
-        wb = copy(rb)
+        # One parse with formatting, released before the file is replaced
+        with open_workbook_readonly(arquivo, formatting_info=True) as rb:
+            sheet_names = rb.sheet_names()
+            if plan.output_sheet in sheet_names:
+                print(f"Sheet '{plan.output_sheet}' already exists. Skipping.")
+                return LayoutResult(arquivo, 'skipped', 0, time.perf_counter() - started,
+                                    f"Sheet '{plan.output_sheet}' already exists")
+            
+            with profiled("extract"):
+                rows = plan.run(rb.sheet_by_index(plan.sheet_index), filename_record)
+            print(f"Extracted {len(rows)} rows with model '{modelo}'")
+            
+            # Copy the workbook for writing
+            with profiled("copy"):
+                wb = copy(rb)
         
-        # Check if sheet already exists
-        sheet_names = [sheet.name for sheet in rb.sheets()]
-        if 'NovaAba' in sheet_names:
-            print("Sheet 'NovaAba' already exists. Skipping.")
-            return
+        # Back up the file before any modification; identical content is stored only once
+        if backup:
+            with profiled("backup"):
+                BACKUP_STORE.backup(arquivo)
         
         # Add new sheet
-        nova_aba = wb.add_sheet('NovaAba')
-        
-        # Create styles
-        header_style, data_style = create_table_styles()
-        
-        # Define headers
-        headers = ["IDD_CONCESION", "IDD_OPERADOR", "Servicio", "Periodo", "Mensajes", "Monto", "Tramo_Tarifario", "Descripcion_tramo_tarifario"]
-        
-        # Write headers
-        for col_num, header in enumerate(headers):
-            nova_aba.write(0, col_num, header, header_style)
+        new_sheet = wb.add_sheet(plan.output_sheet)
         
-        # Read data from first sheet
-        first_sheet = rb.sheet_by_index(0)
+        # Track column widths while writing so no second pass over the data is needed
+        writer = WidthTrackingWriter(new_sheet)
         
-        # Find MENSAJES1 and MENSAJES2 dynamically
-        MENSAJES1, MENSAJES2 = find_subtotal_values(first_sheet)
-        print(f"Found MENSAJES1: {MENSAJES1}, MENSAJES2: {MENSAJES2}")
+        # Write headers and rows
+        with profiled("write"):
+            writer.write_row(0, plan.headers, header_style)
+            for row_idx, row in enumerate(rows, start=1):
+                writer.write_row(row_idx, row, data_style)
         
-        # Read monetary and tariff values
-        MONTO1 = float(str(first_sheet.cell_value(model_fields["MONTO1"]["row"], model_fields["MONTO1"]["col"])).replace('$', '').replace('.', ''))
-        MONTO2 = float(str(first_sheet.cell_value(model_fields["MONTO2"]["row"], model_fields["MONTO2"]["col"])).replace('$', '').replace('.', ''))
-        TARIFA1 = float(str(first_sheet.cell_value(model_fields["TARIFA1"]["row"], model_fields["TARIFA1"]["col"])).replace('$', '').replace(',', '.'))
-        TARIFA2 = float(str(first_sheet.cell_value(model_fields["TARIFA2"]["row"], model_fields["TARIFA2"]["col"])).replace('$', '').replace(',', '.'))
-        
-        # Read other values
-        DESCRIPCION1 = first_sheet.cell_value(model_fields["DESCRIPCION_TRAMO_TARIFARIO1"]["row"], model_fields["DESCRIPCION_TRAMO_TARIFARIO1"]["col"])
-        DESCRIPCION2 = first_sheet.cell_value(model_fields["DESCRIPCION_TRAMO_TARIFARIO2"]["row"], model_fields["DESCRIPCION_TRAMO_TARIFARIO2"]["col"])
-        
-        # Write first row
-        nova_aba.write(1, 0, filename_data['IDD_CONCESION'], data_style)
-        nova_aba.write(1, 1, filename_data['IDD_OPERADOR'], data_style)
-        nova_aba.write(1, 2, filename_data['SERVICIO'], data_style)
-        nova_aba.write(1, 3, filename_data['PERIODO'], data_style)
-        nova_aba.write(1, 4, MENSAJES1, data_style)
-        nova_aba.write(1, 5, MONTO1, data_style)
-        nova_aba.write(1, 6, TARIFA1, data_style)
-        nova_aba.write(1, 7, DESCRIPCION1, data_style)
-        
-        # Write second row
-        nova_aba.write(2, 0, filename_data['IDD_CONCESION'], data_style)
-        nova_aba.write(2, 1, filename_data['IDD_OPERADOR'], data_style)
-        nova_aba.write(2, 2, filename_data['SERVICIO'], data_style)
-        nova_aba.write(2, 3, filename_data['PERIODO'], data_style)
-        nova_aba.write(2, 4, MENSAJES2, data_style)
-        nova_aba.write(2, 5, MONTO2, data_style)
-        nova_aba.write(2, 6, TARIFA2, data_style)
-        nova_aba.write(2, 7, DESCRIPCION2, data_style)
-        
-        # Auto-adjust column widths
-        for col_num in range(len(headers)):
-            max_width = 0
-            
-            # Check header width
-            header_width = len(str(headers[col_num])) * 256
-            max_width = max(max_width, header_width)
-            
-            # Check data width for first row
-            data_values = [filename_data['IDD_CONCESION'], filename_data['IDD_OPERADOR'], 
-                          filename_data['SERVICIO'], filename_data['PERIODO'], 
-                          MENSAJES1, MONTO1, TARIFA1, DESCRIPCION1]
-            
-            if col_num < len(data_values):
-                data_width = len(str(data_values[col_num])) * 256
-                max_width = max(max_width, data_width)
-            
-            # Set minimum width and add padding
-            min_width = 10 * 256
-            final_width = max(max_width + 512, min_width)
-            
-            nova_aba.col(col_num).width = final_width
+        # Set column widths from the widest value written in each column
+        writer.apply_widths()
         
         # Save the modified file
-        wb.save(arquivo)
-        print("New sheet 'NovaAba' added successfully!")
+        with profiled("save"):
+            atomic_save(wb, arquivo)
+        print(f"New sheet '{plan.output_sheet}' added successfully!")
+        print(f"File now contains {len(sheet_names) + 1} sheets: {sheet_names + [plan.output_sheet]}")
         
-        # Verify the original sheet is intact
-        rb_verify = xlrd.open_workbook(arquivo)
-        print(f"File now contains {len(rb_verify.sheets())} sheets: {[sheet.name for sheet in rb_verify.sheets()]}")
+        return LayoutResult(arquivo, 'added', len(rows), time.perf_counter() - started,
+                            f"Sheet '{plan.output_sheet}' added with {len(rows)} rows")
         
     except Exception as e:
         # Log the error with timestamp
@@ -233,14 +150,128 @@ def layout_317(arquivo, modelo):
         print("Full traceback:")
         traceback.print_exc()
         
-        # Restore from backup if it exists
-        if 'backup_file' in locals():
-            print("Restoring from backup...")
-            shutil.copy2(backup_file, arquivo)
-            print("Original file restored.")
+        # The file is only replaced by a complete atomic save, so there is nothing to restore
+        print(f"Original file left unchanged: {arquivo}")
+        return LayoutResult(arquivo, 'failed', 0, time.perf_counter() - started, f"{type(e).__name__}: {e}")
+
+def _count(result):
+    if result.status == 'added':
+        FILES.inc(stage='layout', result='processed')
+    elif result.status == 'failed':
+        FILES.inc(stage='layout', result='failed')
+
+def layout_317(arquivo, modelo):
+    """
+    Add a resume sheet to an Excel file based on a layout model.
+    
+    The model is read from layout_models/model_<modelo>.json and compiled
+    once per process by Utils.layout_engine, so a new operator layout only
+    needs a new JSON file.
+    
+    Args:
+        arquivo (str): Path to the Excel file
+        modelo (str): Model name, e.g. '317'
+        
+    Returns:
+        LayoutResult: Outcome of the file
+    """
+    result = _process_file(arquivo, modelo)
+    _count(result)
+    return result
+
+def _init_worker(modelo, profile_settings):
+    # Runs once in each pool process: Excel libraries, logger, plan and styles are ready before the first file.
+    # Spawned workers (Windows) don't inherit the parent's --profile settings, so they are passed in
+    PROFILER.configure(*profile_settings)
+    # Warm-up imports: _process_file imports these lazily, so the first file doesn't pay for them
+    import xlrd  # noqa: F401
+    from xlutils.copy import copy  # noqa: F401
+    shared_state(modelo)
+
+def _worker(arquivo, modelo):
+    # One outermost profiling scope per file, so its stages are sampled and reported together
+    with profiled(os.path.basename(arquivo)):
+        return _process_file(arquivo, modelo, backup=False)
+
+def layout_directory(directory, modelo='317', pattern=None, workers=None):
+    """
+    Add the model's sheet to every matching file of a directory.
+    
+    The cheap, I/O-bound steps run here once: matching the files, skipping
+    those that already have the output sheet and taking the backups, which
+    share one index file. The CPU-bound parse, copy, write and save of the
+    remaining files run in a process pool whose workers load the Excel
+    libraries, the plan and the styles once at startup.
+    
+    Args:
+        directory (str): Directory with the Excel files
+        modelo (str): Model name, e.g. '317'
+        pattern (str): Glob of the files to process; defaults to '<modelo>_*.xls'
+        workers (int): Pool processes; defaults to the CPU count, 1 runs in this process
+        
+    Returns:
+        List[LayoutResult]: One result per matching file, sorted by file name
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    paths = sorted(glob.glob(os.path.join(directory, pattern or f"{modelo}_*.xls")))
+    logger, plan, _ = shared_state(modelo)
+    
+    results = []
+    pending = []
+    for path in paths:
+        try:
+            with open_workbook_readonly(path) as book:
+                has_sheet = plan.output_sheet in book.sheet_names()
+            if has_sheet:
+                results.append(LayoutResult(path, 'skipped', 0, 0.0,
+                                            f"Sheet '{plan.output_sheet}' already exists"))
+                continue
+            BACKUP_STORE.backup(path)
+        except Exception as e:
+            logger.error(f"Error processing file '{path}' with model '{modelo}': {e}")
+            results.append(LayoutResult(path, 'failed', 0, 0.0, f"{type(e).__name__}: {e}"))
+            continue
+        pending.append(path)
+    
+    workers = min(workers or os.cpu_count() or 1, max(len(pending), 1))
+    print(f"📂 {len(paths)} files match, {len(pending)} to process with {workers} workers")
+    if workers == 1:
+        results.extend(_worker(path, modelo) for path in pending)
+    else:
+        profile_settings = (PROFILER.mode, PROFILER.sample_rate, PROFILER.top, PROFILER.output_dir)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(modelo, profile_settings)) as executor:
+            results.extend(executor.map(_worker, pending, [modelo] * len(pending)))
+    
+    for result in results:
+        _count(result)
+    return sorted(results, key=lambda result: result.file)
 
 # Example usage
 if __name__ == "__main__":
-    arquivo = '317_225_WOM_S.A._202505_TBAJ_R_I_20250607_232028.xls'
-    modelo = '317'
-    layout_317(arquivo, modelo) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Add the sheet described by a layout model to an Excel file, "
+                                                 "or to every matching file of a directory.")
+    parser.add_argument("arquivo", nargs="?", default='317_225_WOM_S.A._202505_TBAJ_R_I_20250607_232028.xls',
+                        help="Excel file or directory to process")
+    parser.add_argument("--modelo", default='317', help="Layout model name, read from layout_models/model_<modelo>.json")
+    parser.add_argument("--pattern", help="For a directory, glob of the files to process (default: <modelo>_*.xls)")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="For a directory, number of worker processes (default: CPU count)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(parser, args)
+    
+    if os.path.isdir(args.arquivo):
+        results = layout_directory(args.arquivo, args.modelo, args.pattern, args.workers)
+        for result in results:
+            print(f"{result.status:8} {result.rows:6} rows {result.seconds:7.2f}s  "
+                  f"{os.path.basename(result.file)}  {result.message}")
+        statuses = [result.status for result in results]
+        print(f"\n{statuses.count('added')} added, {statuses.count('skipped')} skipped, "
+              f"{statuses.count('failed')} failed")
+        sys.exit(1 if 'failed' in statuses or not results else 0)
+    
+    with profiled(os.path.basename(args.arquivo)):
+        result = layout_317(args.arquivo, args.modelo)
+    sys.exit(1 if result.status == 'failed' else 0)
@@ -1,22 +1,304 @@
 import os
 import sys
-import subprocess
+from contextlib import nullcontext
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Iterator, List, Optional, Tuple
 import glob
+import argparse
+import queue
+import threading
+import time
 
-# Import the functions from other modules
-from generate_rating_component_list import generate_rating_component_list
-from get_rates_info import get_rates_info
-from generate_resumen_info import generate_resumen_info
-from generate_sheet_resumen import generate_sheet_resumen
+# Stage modules (DB and Excel) are imported inside the functions that use them,
+# so --help and --dry-run start without loading them
+from Utils.filename_parser import FilenameError, FilenameRecord, ValidationReport, load_rating_components, parse_filename, validate_filenames
+from Utils.folder_watcher import FolderWatcher
+from Utils.rates_index import RatesIndex
+from Utils.billing_calendar import BillingCalendar
+from Utils.job_workspace import JobWorkspace
+from Utils.work_ledger import FAILED, LEDGER_FILE_NAME, WorkLedger, parse_shard, shard_of
+from Utils.profiling import PROFILER, add_profile_arguments, configure_from_args, profiled
+from Utils.concurrency import DEFAULT_CEILING, DEFAULT_FLOOR, LIMITER, parse_limits
+from Utils.resumen_archive import ARCHIVE_DIR, ArchiveWriter
+from Utils.metrics import CACHE_REQUESTS, FILES, LAST_RUN_SECONDS, LAST_SUCCESS, REGISTRY, WATCH_QUEUE_DEPTH, start_http_server
 
-def process_directory(directory_path: str) -> Tuple[bool, str]:
+RATING_COMPONENT_FILE = Path(__file__).parent / "SQL_files" / "rating_component_list.csv"
+# Intermediate files, written inside each job's workspace (Utils.job_workspace)
+RATES_FILE = "rates_info_search.csv"
+PERIOD_RATES_FILE = "rates_info_period.csv"
+BILLING_PERIODS_FILE = "billing_periods.csv"
+RESUMEN_CSV = "generate_resumen_infos_{line}.csv"
+RESUMEN_FILE = "resumen.txt"
+
+# Watch mode defaults
+WATCH_POLL_INTERVAL = 2.0
+WATCH_DEBOUNCE = 5.0
+WATCH_QUEUE_SIZE = 100
+WATCH_COMPONENT_REFRESH = 3600
+WATCH_METRICS_INTERVAL = 15.0
+
+def build_resumen_for_group(query_key: Tuple[str, str, str, str, str], work_dir: Path,
+                            rates_index: Optional[RatesIndex] = None) -> Tuple[bool, str, int]:
+    """
+    Run rates_info_search and the resumen queries once for a query key and write resumen.txt.
+    
+    Args:
+        query_key: (franchise, operator, period, rating_component, component_direction)
+        work_dir: Job workspace for the intermediate files and resumen.txt
+        rates_index: Prefetched period rates; periods it holds skip rates_info_search
+        
+    Returns:
+        Tuple[bool, str, int]: (success, message, resumen_line_count)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from get_rates_info import run_rates_info_search
+    from generate_resumen_info import generate_resumen_info
+    
+    group_name = '_'.join(query_key)
+    franchise, operator, period = query_key[:3]
+    rates_file = work_dir / RATES_FILE
+    
+    # Get rates info for this query key, from the period prefetch when available
+    if rates_index is not None and rates_index.has_period(franchise, period):
+        CACHE_REQUESTS.inc(cache='rates_prefetch', result='hit')
+        rates_lines = rates_index.lookup(query_key)
+        with open(rates_file, 'w', encoding='utf-8') as f:
+            f.writelines(line + '\n' for line in rates_lines)
+        print(f"⚡ Served {len(rates_lines)} rates rows for {group_name} from the period prefetch")
+    else:
+        if rates_index is not None:
+            CACHE_REQUESTS.inc(cache='rates_prefetch', result='miss')
+        success, stdout, stderr, exit_code = run_rates_info_search(list(query_key), work_dir)
+        if not success:
+            return False, f"Error querying rates for {group_name}: {stderr}", 0
+    
+    # Process rates_info_search.csv and generate resumen.txt for this query key
+    print(f"📊 Generating resumen.txt for {group_name}...")
+    
+    if not rates_file.exists():
+        return False, f"rates_info_search.csv not found for {group_name}", 0
+    
+    # Read rates_info_search.csv to get number of lines
+    with open(rates_file, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    
+    # Remove empty lines
+    valid_lines = [line for line in lines if line.strip()]
+    
+    if not valid_lines:
+        return False, f"rates_info_search.csv is empty for {group_name}", 0
+    
+    print(f"📋 Found {len(valid_lines)} lines in rates_info_search.csv")
+    
+    # Process each line and write to resumen.txt. Lines are submitted together and the
+    # adaptive limiter decides how many of their queries run at once
+    profile_context = PROFILER.context()
+    
+    def run_line(line_num: int) -> Optional[str]:
+        output_name = RESUMEN_CSV.format(line=line_num)
+        # Pool threads start with no profiling scope; nest this line's query under the caller's
+        with PROFILER.attach(profile_context), profiled(f"line_{line_num}"):
+            success, stdout, stderr, exit_code = generate_resumen_info(line_num, work_dir, output_name)
+        
+        if not success:
+            print(f"    ❌ Error processing line {line_num}: {stderr}")
+            return None
+        # Read the generated output from this line's csv
+        if not (work_dir / output_name).exists():
+            print(f"    ⚠️  Line {line_num} - {output_name} not found")
+            return None
+        with open(work_dir / output_name, 'r', encoding='utf-8') as f:
+            csv_content = f.read().strip()
+        if not csv_content:
+            print(f"    ⚠️  Line {line_num} generated empty content")
+            return None
+        print(f"    ✅ Line {line_num} processed successfully")
+        return csv_content
+    
+    print(f"  Processing {len(valid_lines)} lines, up to {LIMITER.ceiling} queries at a time...")
+    with ThreadPoolExecutor(max_workers=LIMITER.ceiling, thread_name_prefix="resumen-line") as executor:
+        # map keeps the rates file order, which resumen.txt follows
+        results = list(executor.map(run_line, range(1, len(valid_lines) + 1)))
+    resumen_content = [content for content in results if content is not None]
+    
+    if not resumen_content:
+        return False, f"No content was generated for resumen.txt for {group_name}", 0
+    
+    # Write resumen.txt
+    with open(work_dir / RESUMEN_FILE, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(resumen_content))
+    
+    return True, f"resumen.txt generated successfully for {group_name}!", len(resumen_content)
+
+def prefetch_rates(query_keys: List[Tuple[str, str, str, str, str]], work_dir: Path,
+                   rates_index: Optional[RatesIndex] = None) -> RatesIndex:
+    """
+    Fetch all rates of every (franchise, period) in query_keys with one query each.
+    
+    Periods whose prefetch fails are left out of the index, so their groups
+    fall back to one rates_info_search query per group. Periods are added to
+    rates_index when given, so it can be filled one claimed group at a time.
+    """
+    from get_rates_info import prefetch_period_rates
+    
+    if rates_index is None:
+        rates_index = RatesIndex()
+    for franchise, period in sorted({(key[0], key[2]) for key in query_keys}):
+        print(f"⚡ Prefetching rates for franchise {franchise}, period {period}...")
+        success, stdout, stderr, exit_code = prefetch_period_rates(franchise, period, work_dir)
+        if not success or not (work_dir / PERIOD_RATES_FILE).exists():
+            print(f"⚠️  Prefetch failed for {franchise}/{period}, falling back to per-group queries: {stderr}")
+            continue
+        row_count = rates_index.add_period_file(franchise, period, work_dir / PERIOD_RATES_FILE)
+        print(f"✅ Indexed {row_count} rates rows for {franchise}/{period}")
+    return rates_index
+
+def load_billing_calendar(query_keys: List[Tuple[str, str, str, str, str]], work_dir: Path) -> BillingCalendar:
+    """
+    Load the billing periods of every franchise in query_keys, one query per franchise.
+    
+    Franchises whose query fails are left out, so their Resumen rows keep the
+    FED/LED returned by the resumen query.
+    """
+    from get_rates_info import fetch_billing_periods
+    
+    periods_by_franchise = {}
+    for key in query_keys:
+        periods_by_franchise.setdefault(key[0], set()).add(key[2])
+    
+    lines = []
+    for franchise, periods in sorted(periods_by_franchise.items()):
+        success, stdout, stderr, exit_code = fetch_billing_periods(franchise, min(periods), max(periods), work_dir)
+        if not success or not (work_dir / BILLING_PERIODS_FILE).exists():
+            print(f"⚠️  Could not load billing periods for franchise {franchise}: {stderr}")
+            continue
+        with open(work_dir / BILLING_PERIODS_FILE, 'r', encoding='utf-8') as f:
+            lines.extend(line for line in f if line.strip())
+    
+    calendar = BillingCalendar.from_lines(lines)
+    print(f"📅 Loaded {len(calendar)} billing period windows")
+    return calendar
+
+def report_plan(report: ValidationReport, prefetch: bool) -> Tuple[bool, str]:
+    """
+    Print the work a run would do for a validation report, without touching the DB or Excel files.
+    
+    Returns:
+        Tuple[bool, str]: (success, summary_message)
+    """
+    print("\n🧪 Dry run: planned query groups")
+    for query_key, records in report.groups.items():
+        print(f"  📦 {'_'.join(query_key)}: {len(records)} files")
+        for record in records:
+            print(f"     - {record.filename}")
+    
+    periods = {(key[0], key[2]) for key in report.groups}
+    rates_queries = len(periods) if prefetch else len(report.groups)
+    print(f"\n📋 Rates queries: {rates_queries} "
+          f"({'one per billing period' if prefetch else 'one per query group'})")
+    print(f"📋 Workbooks to update: {len(report.valid)}")
+    
+    return True, (f"Dry run: {len(report.valid)} files in {len(report.groups)} query groups, "
+                  f"{len(report.invalid)} rejected")
+
+def process_group(query_key: Tuple[str, str, str, str, str], records: List[FilenameRecord], dir_path: Path,
+                  work_dir: Path, rates_index: Optional[RatesIndex] = None,
+                  calendar: Optional[BillingCalendar] = None,
+                  archive: Optional[ArchiveWriter] = None,
+                  keep_lease: Optional[Callable[[], bool]] = None) -> Tuple[List[str], bool]:
+    """
+    Build the resumen of one query group and add the Resumen sheet to every file in it.
+    
+    keep_lease, when given, is called before each file is written and stops the
+    group when it returns False, i.e. when another node took over the group.
+    
+    Returns:
+        Tuple[List[str], bool]: (processed_file_names, every_file_succeeded)
+    """
+    from generate_sheet_resumen import generate_sheet_resumen
+    
+    group_name = '_'.join(query_key)
+    print(f"\n📦 Query group {group_name} ({len(records)} files)")
+    
+    # Step 4a/4b: Query rates and generate resumen.txt once for the whole group
+    with profiled("resumen"):
+        success, message, line_count = build_resumen_for_group(query_key, work_dir, rates_index)
+    if not success:
+        print(f"❌ {message}")
+        # None of the group's files get a Resumen sheet
+        FILES.inc(len(records), stage='resumen', result='failed')
+        return [], False
+    
+    print(f"✅ {message}")
+    print(f"📊 Total lines processed: {line_count}")
+    
+    # Step 4c: Generate Resumen sheet in every Excel file of the group
+    processed_files = []
+    for record in records:
+        xls_file = dir_path / record.filename
+        if keep_lease is not None and not keep_lease():
+            print(f"⚠️  Lost the lease on {group_name}, leaving its remaining files to the node that holds it")
+            return processed_files, False
+        print(f"📝 Adding Resumen sheet to {xls_file.name}...")
+        with profiled(record.filename):
+            success, message = generate_sheet_resumen(str(xls_file), calendar, work_dir, query_key, archive)
+        
+        if success:
+            print(f"✅ {message}")
+            processed_files.append(xls_file.name)
+        else:
+            print(f"❌ Error adding Resumen sheet to {xls_file.name}: {message}")
+    
+    return processed_files, len(processed_files) == len(records)
+
+def shard_groups(query_keys: List[Tuple[str, str, str, str, str]],
+                 shard: Optional[Tuple[int, int]]) -> List[Tuple[str, str, str, str, str]]:
+    """Return the query keys that belong to shard (i, N), or all of them without a shard."""
+    if shard is None:
+        return query_keys
+    index, count = shard
+    return [key for key in query_keys if shard_of('_'.join(key), count) == index]
+
+def iter_claimed_groups(query_keys: List[Tuple[str, str, str, str, str]], shard: Optional[Tuple[int, int]],
+                        ledger: Optional[WorkLedger]) -> Iterator[Tuple[str, str, str, str, str]]:
+    """
+    Yield the query groups this node should process.
+    
+    Without a ledger that is simply the node's shard. With a ledger, groups are
+    leased one at a time, the node's own shard first and then groups of other
+    shards that are still pending or whose lease expired, so fast nodes help
+    slow ones and a crashed node's groups are picked up again.
+    """
+    own_keys = shard_groups(query_keys, shard)
+    if ledger is None:
+        yield from own_keys
+        return
+    
+    by_name = {'_'.join(key): key for key in query_keys}
+    own = ['_'.join(key) for key in own_keys]
+    own_names = set(own)
+    others = [name for name in by_name if name not in own_names]
+    while True:
+        name = ledger.claim(own) or ledger.claim(others)
+        if name is None:
+            return
+        print(f"📒 Leased {name}")
+        yield by_name[name]
+
+def process_directory(directory_path: str, prefetch: bool = False, dry_run: bool = False,
+                      shard: Optional[Tuple[int, int]] = None, ledger_path: Optional[Path] = None,
+                      archive_dir: Optional[Path] = ARCHIVE_DIR) -> Tuple[bool, str]:
     """
     Process all .xls files in the specified directory.
     
     Args:
         directory_path: Path to directory containing .xls files
+        prefetch: Fetch the rates of each billing period with one query instead of one query per group
+        dry_run: Only validate filenames and report the planned query groups, without touching the DB or Excel files
+        shard: (i, N) to only process the query groups of shard i out of N
+        ledger_path: Shared SQLite work ledger; query groups are leased through it so several
+                     nodes can work on the same directory without processing a group twice
+        archive_dir: Resumen archive the rows of this run are appended to; None to skip archiving
         
     Returns:
         Tuple[bool, str]: (success, error_message)
@@ -34,15 +316,8 @@ def process_directory(directory_path: str) -> Tuple[bool, str]:
     try:
         print(f"🔄 Processing directory: {directory_path}")
         
-        # Step 1: Update rating component list
-        print("\n📋 Step 1: Updating rating component list...")
-        success, stdout, stderr, exit_code = generate_rating_component_list()
-        if not success:
-            return False, f"ERROR: Failed to update rating component list: {stderr}"
-        print("✅ Rating component list updated successfully!")
-        
-        # Step 2: Find all .xls files in directory
-        print(f"\n📁 Step 2: Finding .xls files in {directory_path}...")
+        # Step 1: Find all .xls files in directory
+        print(f"\n📁 Step 1: Finding .xls files in {directory_path}...")
         xls_files = list(dir_path.glob("*.xls"))
         
         if not xls_files:
@@ -52,90 +327,99 @@ def process_directory(directory_path: str) -> Tuple[bool, str]:
         for file in xls_files:
             print(f"  - {file.name}")
         
-        # Step 3: Process each .xls file individually
-        print(f"\n🔄 Step 3: Processing .xls files...")
-        processed_files = []
+        # Step 2: Validate every filename before any DB or Excel work
+        print("\n🔎 Step 2: Validating filenames...")
+        rating_components = load_rating_components(RATING_COMPONENT_FILE)
+        report = validate_filenames([file.name for file in xls_files], rating_components)
         
-        for xls_file in xls_files:
-            print(f"\n📄 Processing file: {xls_file.name}")
-            
-            # Step 3a: Get rates info for this file
-            success, stdout, stderr, exit_code = get_rates_info(xls_file.name)
-            
-            if not success:
-                print(f"❌ Error processing file {xls_file.name}: {stderr}")
-                continue
-            
-            print(f"✅ File {xls_file.name} processed successfully!")
-            
-            # Step 3b: Process rates_info_search.csv and generate resumen.txt for this file
-            print(f"📊 Generating resumen.txt for {xls_file.name}...")
-            
-            rates_file = Path(__file__).parent / "SQL_files" / "rates_info_search.csv"
-            resumen_file = Path(__file__).parent / "resumen.txt"
-            
-            if not rates_file.exists():
-                print(f"❌ rates_info_search.csv not found for {xls_file.name}")
-                continue
+        for filename, error in report.invalid:
+            print(f"  ❌ Rejected {filename}: {error}")
+        print(f"📋 Validation report: {report.summary()}")
+        
+        if not report.valid:
+            return False, f"ERROR: No valid .xls filenames found in directory: {directory_path}"
+        
+        if dry_run:
+            return report_plan(report, prefetch)
+        
+        from generate_rating_component_list import generate_rating_component_list
+        
+        # Step 3: Update rating component list
+        print("\n📋 Step 3: Updating rating component list...")
+        success, stdout, stderr, exit_code = generate_rating_component_list()
+        if not success:
+            return False, f"ERROR: Failed to update rating component list: {stderr}"
+        print("✅ Rating component list updated successfully!")
+        
+        # Re-parse with the refreshed rating components before planning the query groups
+        report = validate_filenames([record.filename for record in report.valid],
+                                    load_rating_components(RATING_COMPONENT_FILE))
+        for filename, error in report.invalid:
+            print(f"  ❌ Rejected {filename}: {error}")
+        
+        ledger = None
+        if ledger_path is not None:
+            ledger = WorkLedger(ledger_path)
+            epoch = ledger.register('_'.join(query_key) for query_key in report.groups)
+            print(f"📒 Work ledger {ledger.path} as {ledger.owner}, epoch {epoch}")
+        
+        # Every intermediate file of this run lives in its own workspace, so concurrent runs don't mix results
+        with JobWorkspace(f"run_{dir_path.name}") as workspace:
+            print(f"🗂️  Job workspace: {workspace.path}")
             
-            # Read rates_info_search.csv to get number of lines
-            with open(rates_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            # Groups this node works on: its shard, then, with a ledger, whatever other nodes left
+            claimed_groups = iter_claimed_groups(list(report.groups), shard, ledger)
             
-            # Remove empty lines
-            valid_lines = [line for line in lines if line.strip()]
+            # Periods are prefetched as their first group is claimed, whichever shard it belongs to
+            rates_index = RatesIndex() if prefetch else None
+            prefetched_periods = set()
             
-            if not valid_lines:
-                print(f"❌ rates_info_search.csv is empty for {xls_file.name}")
-                continue
+            # Billing periods are loaded once per run and used to fill and order the Resumen rate windows
+            print("\n📅 Loading billing period calendar...")
+            calendar = load_billing_calendar(list(report.groups), workspace.path)
             
-            print(f"📋 Found {len(valid_lines)} lines in rates_info_search.csv")
+            # Step 4: Process each query group once and fan the result out to every file in it
+            print(f"\n🔄 Step 4: Processing {len(report.valid)} .xls files in {len(report.groups)} query groups...")
+            processed_files = []
+            archive = ArchiveWriter(archive_dir) if archive_dir is not None else None
             
-            # Process each line and write to resumen.txt
-            resumen_content = []
+            for query_key in claimed_groups:
+                group_name = '_'.join(query_key)
+                group_dir = workspace.subdir(group_name)
+                # With a ledger, keep the lease alive while the group runs, then record the outcome for the other nodes
+                lease = ledger.hold(group_name) if ledger is not None else nullcontext()
+                keep_lease = (lambda: ledger.heartbeat(group_name)) if ledger is not None else None
+                with lease, profiled(group_name):
+                    period_key = (query_key[0], query_key[2])
+                    if rates_index is not None and period_key not in prefetched_periods:
+                        prefetched_periods.add(period_key)
+                        prefetch_rates([query_key], workspace.path, rates_index)
+                    group_files, group_ok = process_group(query_key, report.groups[query_key], dir_path,
+                                                          group_dir, rates_index, calendar, archive, keep_lease)
+                if ledger is not None:
+                    recorded = ledger.done(group_name) if group_ok else ledger.failed(group_name)
+                    if not recorded:
+                        print(f"⚠️  Lost the lease on {group_name} before recording its outcome; "
+                              f"another node may have processed it too")
+                        group_ok = False
+                processed_files.extend(group_files)
+                if not group_ok:
+                    workspace.mark_failed()
             
-            for line_num in range(1, len(valid_lines) + 1):
-                print(f"  Processing line {line_num}...")
-                
-                success, stdout, stderr, exit_code = generate_resumen_info(line_num)
-                
-                if success:
-                    # Read the generated output from generate_resumen_infos.csv
-                    resumen_csv = Path(__file__).parent / "SQL_files" / "generate_resumen_infos.csv"
-                    if resumen_csv.exists():
-                        with open(resumen_csv, 'r', encoding='utf-8') as f:
-                            csv_content = f.read().strip()
-                            if csv_content:
-                                resumen_content.append(csv_content)
-                                print(f"    ✅ Line {line_num} processed successfully")
-                            else:
-                                print(f"    ⚠️  Line {line_num} generated empty content")
-                    else:
-                        print(f"    ⚠️  Line {line_num} - generate_resumen_infos.csv not found")
-                else:
-                    print(f"    ❌ Error processing line {line_num}: {stderr}")
+            if archive is not None:
+                archive.flush()
             
-            # Write resumen.txt
-            if resumen_content:
-                with open(resumen_file, 'w', encoding='utf-8') as f:
-                    f.write('\n'.join(resumen_content))
-                
-                print(f"✅ resumen.txt generated successfully for {xls_file.name}!")
-                print(f"📊 Total lines processed: {len(resumen_content)}")
-                
-                # Step 3c: Generate Resumen sheet in the Excel file
-                print(f"📝 Adding Resumen sheet to {xls_file.name}...")
-                success, message = generate_sheet_resumen(str(xls_file))
-                
-                if success:
-                    print(f"✅ {message}")
-                    processed_files.append(xls_file.name)
-                else:
-                    print(f"❌ Error adding Resumen sheet to {xls_file.name}: {message}")
-            else:
-                print(f"❌ No content was generated for resumen.txt for {xls_file.name}")
+            ledger_failed = 0
+            if ledger is not None:
+                counts = ledger.counts()
+                ledger_failed = counts.get(FAILED, 0)
+                print(f"\n📒 Ledger {ledger.path}: {counts}")
         
         if not processed_files:
+            if ledger_failed:
+                return False, f"ERROR: {ledger_failed} query groups failed in this ledger epoch"
+            if (shard or ledger) and not workspace.failed:
+                return True, "No query groups left for this node"
             return False, "ERROR: No files were processed successfully"
         
         return True, f"Successfully processed {len(processed_files)} files with Resumen sheets"
@@ -143,19 +427,232 @@ def process_directory(directory_path: str) -> Tuple[bool, str]:
     except Exception as e:
         return False, f"ERROR: {e}"
 
+def process_watched_file(xls_file: Path, rating_components: List[str],
+                         archive: Optional[ArchiveWriter] = None) -> Tuple[bool, str]:
+    """
+    Add the Resumen sheet to a single file picked up in watch mode.
+    
+    Args:
+        xls_file: Path to the .xls file
+        rating_components: Cached rating component ids used to parse the filename
+        archive: Watch session's archive writer, flushed after the file
+        
+    Returns:
+        Tuple[bool, str]: (success, message)
+    """
+    from generate_sheet_resumen import generate_sheet_resumen
+    
+    try:
+        record = parse_filename(xls_file.name, rating_components)
+    except FilenameError as e:
+        return False, f"Rejected {xls_file.name}: {e}"
+    
+    # One workspace per file: kept for debugging when the file fails
+    with JobWorkspace(xls_file.stem) as workspace:
+        with profiled("resumen"):
+            success, message, line_count = build_resumen_for_group(record.query_key, workspace.path)
+        if not success:
+            FILES.inc(stage='resumen', result='failed')
+            workspace.mark_failed()
+            return False, message
+        print(f"✅ {message}")
+        
+        success, message = generate_sheet_resumen(str(xls_file), work_dir=workspace.path,
+                                                  query_key=record.query_key, archive=archive)
+        if not success:
+            workspace.mark_failed()
+        if archive is not None:
+            archive.flush()
+        return success, message
+
+def watch_directory(directory_path: str, poll_interval: float = WATCH_POLL_INTERVAL,
+                    debounce: float = WATCH_DEBOUNCE, queue_size: int = WATCH_QUEUE_SIZE,
+                    include_existing: bool = False, metrics_file: Optional[Path] = None,
+                    metrics_port: Optional[int] = None, archive_dir: Optional[Path] = ARCHIVE_DIR) -> Tuple[bool, str]:
+    """
+    Watch a directory and add the Resumen sheet to .xls files as they arrive.
+    
+    The folder is polled every poll_interval seconds. New or changed files are
+    queued once they have been stable for debounce seconds and processed by a
+    worker thread. The queue is bounded, so polling pauses while the worker is
+    behind. The rating component list is loaded once and refreshed every
+    WATCH_COMPONENT_REFRESH seconds instead of once per file. Runs until
+    interrupted with Ctrl+C.
+    
+    Args:
+        directory_path: Directory to watch
+        poll_interval: Seconds between directory scans
+        debounce: Seconds a file must stay unchanged before it is processed
+        queue_size: Maximum number of files waiting for the worker
+        include_existing: Also process files already in the directory at startup
+        metrics_file: Textfile exporter output, rewritten every WATCH_METRICS_INTERVAL seconds
+        metrics_port: Serve the metrics on http://127.0.0.1:<port>/metrics
+        archive_dir: Resumen archive each file's rows are appended to; None to skip archiving
+        
+    Returns:
+        Tuple[bool, str]: (success, message)
+    """
+    from generate_rating_component_list import generate_rating_component_list
+    
+    dir_path = Path(directory_path)
+    if not dir_path.is_dir():
+        return False, f"ERROR: Directory does not exist or is not a directory: {directory_path}"
+    
+    success, stdout, stderr, exit_code = generate_rating_component_list()
+    if not success:
+        return False, f"ERROR: Failed to update rating component list: {stderr}"
+    components = {"ids": load_rating_components(RATING_COMPONENT_FILE), "loaded_at": time.monotonic()}
+    
+    watcher = FolderWatcher(dir_path, debounce=debounce, include_existing=include_existing)
+    work_queue: "queue.Queue[Optional[Path]]" = queue.Queue(maxsize=queue_size)
+    counts = {"processed": 0, "failed": 0}
+    archive = ArchiveWriter(archive_dir) if archive_dir is not None else None
+    
+    def worker() -> None:
+        while True:
+            xls_file = work_queue.get()
+            if xls_file is None:
+                break
+            try:
+                if time.monotonic() - components["loaded_at"] > WATCH_COMPONENT_REFRESH:
+                    success, stdout, stderr, exit_code = generate_rating_component_list()
+                    if success:
+                        components["ids"] = load_rating_components(RATING_COMPONENT_FILE)
+                        components["loaded_at"] = time.monotonic()
+                    else:
+                        print(f"⚠️  Could not refresh rating component list, keeping cached one: {stderr}")
+                
+                print(f"\n📄 Processing file: {xls_file.name}")
+                with profiled(xls_file.name):
+                    success, message = process_watched_file(xls_file, components["ids"], archive)
+                if success:
+                    counts["processed"] += 1
+                    print(f"✅ {message}")
+                else:
+                    counts["failed"] += 1
+                    print(f"❌ {message}")
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"❌ Error processing {xls_file.name}: {e}")
+            finally:
+                watcher.mark_done(xls_file)
+                work_queue.task_done()
+    
+    worker_thread = threading.Thread(target=worker, name="resumen-worker", daemon=True)
+    worker_thread.start()
+    
+    if metrics_port is not None:
+        start_http_server(metrics_port)
+        print(f"📈 Serving metrics on http://127.0.0.1:{metrics_port}/metrics")
+    
+    print(f"👀 Watching {directory_path} for .xls files (Ctrl+C to stop)...")
+    metrics_written_at = 0.0
+    try:
+        while True:
+            for xls_file in watcher.poll():
+                print(f"📥 Queued {xls_file.name}")
+                work_queue.put(xls_file)
+            WATCH_QUEUE_DEPTH.set(work_queue.qsize())
+            if metrics_file is not None and time.monotonic() - metrics_written_at >= WATCH_METRICS_INTERVAL:
+                REGISTRY.write_textfile(metrics_file)
+                metrics_written_at = time.monotonic()
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping watcher, finishing queued files...")
+    
+    work_queue.put(None)
+    worker_thread.join()
+    WATCH_QUEUE_DEPTH.set(0)
+    if metrics_file is not None:
+        REGISTRY.write_textfile(metrics_file)
+    
+    return True, f"Watch stopped: {counts['processed']} files processed, {counts['failed']} failed"
+
 if __name__ == "__main__":
-    # Check if directory path is provided as command line argument
-    if len(sys.argv) < 2:
-        print("ERROR: Please provide directory path as argument")
-        print("Usage: python main.py <directory_path>")
-        print("Example: python main.py C:\\path\\to\\xls\\files")
-        print("         python main.py ./Liquidation_files")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Add a Resumen sheet to every .xls liquidation file of a directory.",
+        epilog="Examples: python main.py ./Liquidation_files\n"
+               "          python main.py --watch ./Liquidation_files\n"
+               "          python main.py ./Liquidation_files --shard 1/3 --ledger",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("directory_path", nargs="?", help="Directory containing the .xls files")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="Fetch all rates of each billing period with one query instead of one query per file group")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Validate filenames and report the planned query groups without touching the DB or Excel files")
+    parser.add_argument("--shard", metavar="i/N",
+                        help="Only process the query groups of shard i out of N (1-based), e.g. --shard 1/3")
+    parser.add_argument("--ledger", metavar="PATH", nargs="?", const="",
+                        help="Lease query groups through a shared SQLite work ledger so several nodes can process "
+                             f"the same directory; defaults to DIR/{LEDGER_FILE_NAME}")
+    parser.add_argument("--db-concurrency", metavar="FLOOR:CEILING", default=f"{DEFAULT_FLOOR}:{DEFAULT_CEILING}",
+                        help="Range the number of concurrent DB queries adapts in, from observed latency and errors "
+                             f"(default: {DEFAULT_FLOOR}:{DEFAULT_CEILING})")
+    parser.add_argument("--watch", metavar="DIR",
+                        help="Keep running and process .xls files as they arrive in DIR")
+    parser.add_argument("--watch-existing", action="store_true",
+                        help="In watch mode, also process the files already in DIR at startup")
+    parser.add_argument("--poll-interval", type=float, default=WATCH_POLL_INTERVAL,
+                        help=f"Seconds between directory scans in watch mode (default: {WATCH_POLL_INTERVAL})")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE,
+                        help=f"Seconds a file must stay unchanged before it is processed (default: {WATCH_DEBOUNCE})")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="Write Prometheus metrics to PATH (node_exporter textfile collector format)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="In watch mode, serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--archive-dir", metavar="DIR", default=str(ARCHIVE_DIR),
+                        help="Append the Resumen rows each run writes to this partitioned archive (default: Resumen_archive/)")
+    parser.add_argument("--no-archive", action="store_true",
+                        help="Don't append the Resumen rows to the archive")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(parser, args)
+    
+    if bool(args.directory_path) == bool(args.watch):
+        parser.error("provide either a directory path or --watch DIR")
+    
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
     
-    directory_path = sys.argv[1]
+    try:
+        floor, ceiling = parse_limits(args.db_concurrency)
+    except ValueError as e:
+        parser.error(str(e))
+    LIMITER.configure(floor, ceiling, initial=LIMITER.limit)
+    
+    ledger_path = None
+    if args.ledger is not None:
+        ledger_path = Path(args.ledger) if args.ledger else Path(args.directory_path or ".") / LEDGER_FILE_NAME
     
-    print("🚀 Starting main processing...")
-    success, message = process_directory(directory_path)
+    if args.watch and (shard or ledger_path):
+        parser.error("--shard and --ledger only apply to directory runs, not --watch")
+    if args.metrics_port is not None and not args.watch:
+        parser.error("--metrics-port only applies to --watch")
+    metrics_file = Path(args.metrics_file) if args.metrics_file else None
+    archive_dir = None if args.no_archive else Path(args.archive_dir)
+    
+    if args.watch:
+        print("🚀 Starting watch mode...")
+        success, message = watch_directory(args.watch, poll_interval=args.poll_interval,
+                                           debounce=args.debounce, include_existing=args.watch_existing,
+                                           metrics_file=metrics_file, metrics_port=args.metrics_port,
+                                           archive_dir=archive_dir)
+    else:
+        print("🚀 Starting main processing...")
+        started = time.time()
+        success, message = process_directory(args.directory_path, prefetch=args.prefetch, dry_run=args.dry_run,
+                                             shard=shard, ledger_path=ledger_path, archive_dir=archive_dir)
+        LAST_RUN_SECONDS.set(time.time() - started)
+        if success:
+            LAST_SUCCESS.set(time.time())
+        if metrics_file is not None and not args.dry_run:
+            REGISTRY.write_textfile(metrics_file)
+            print(f"📈 Metrics written to {metrics_file}")
     
     if success:
         print(f"\n🎉 {message}")
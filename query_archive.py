@@ -0,0 +1,58 @@
+import sys
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+from Utils.resumen_archive import ARCHIVE_DIR, COLUMNS, NUMERIC_COLUMNS, ResumenArchive
+
+def parse_filters(values: List[str]) -> Dict[str, str]:
+    """
+    Parse COLUMN=VALUE filters, e.g. ['operator=407'].
+    
+    Raises:
+        ValueError: If a filter is not COLUMN=VALUE
+    """
+    filters = {}
+    for value in values:
+        column, sep, expected = value.partition('=')
+        if not sep or not column:
+            raise ValueError(f"Invalid filter '{value}', expected COLUMN=VALUE such as operator=407")
+        filters[column] = expected
+    return filters
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Aggregate the archived Resumen rows without querying the database.",
+        epilog="Examples: python query_archive.py --periods 202507 202508 202509\n"
+               "          python query_archive.py --by periodo --value cantidad --where operator=407",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--archive-dir", metavar="DIR", default=str(ARCHIVE_DIR),
+                        help="Archive to read (default: Resumen_archive/)")
+    parser.add_argument("--periods", nargs="+", metavar="PERIOD",
+                        help="Only read these period partitions, e.g. 202509")
+    parser.add_argument("--by", nargs="+", default=['idd_operador', 'servicio', 'periodo'], metavar="COLUMN",
+                        help="Columns to group by (default: idd_operador servicio periodo)")
+    parser.add_argument("--value", default='valor', choices=NUMERIC_COLUMNS,
+                        help="Numeric column to sum (default: valor)")
+    parser.add_argument("--where", nargs="+", default=[], metavar="COLUMN=VALUE",
+                        help=f"Only rows whose column equals the value. Columns: {', '.join(COLUMNS)}")
+    parser.add_argument("--all-runs", action="store_true",
+                        help="Include every archived write of each file instead of only the latest one")
+    args = parser.parse_args()
+    
+    archive = ResumenArchive(Path(args.archive_dir))
+    try:
+        results = archive.aggregate(args.by, args.value, args.periods, not args.all_runs,
+                                    **parse_filters(args.where))
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if not results:
+        print(f"No archived rows found in {archive.root}")
+        sys.exit(1)
+    
+    print('\t'.join(list(args.by) + [f"sum_{args.value}", 'rows']))
+    for group, total, count in results:
+        print('\t'.join(list(group) + [f"{total:.12g}", str(count)]))
+    sys.exit(0)